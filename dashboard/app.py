@@ -3,16 +3,26 @@
 # ----------------------------
 from tabs import tab_preview, tab_charts, tab_compare, tab_chat
 from utils.mongo_utils import fetch_wamo_df
+from utils.storage import ensure_storage_indexes, read_dataset, get_dataset_meta, dataset_version
+from utils.compact import compact_frame
+from utils.ingest import ingest_upload, append_upload
+from utils.dataset_cache import get_dataset_cache, cached_derived
+from utils.figure_cache import get_figure_cache
+from utils.llm_cache import get_llm_cache
+from utils.llm_orchestrator import stream_job
+from utils.jobs import get_job_queue, spool_upload, wait_for_job, SpooledUpload
+from utils.profile import get_or_compute_profile, load_stored_profile, compute_profile
+from utils.outliers import outlier_fences, save_fences
+from utils.resources import get_mongo_client, get_llm_client, get_mongo_metrics, mongo_health
+from utils.catalog import ensure_catalog_indexes, backfill_catalog, record_upload, list_uploaded_filenames
+from utils.tracing import start_rerun, finish_rerun, span, frame_stats, render_trace_panel
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 import re
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import HumanMessage
-from langchain_groq import ChatGroq
 from dotenv import load_dotenv
-from pymongo import MongoClient
-import datetime
+import functools
 import os
 import plotly.graph_objects as go
 
@@ -20,14 +30,35 @@ import plotly.graph_objects as go
 # Load secrets
 load_dotenv()
 
-# Init session state
+# Per-rerun trace (no-op unless DASHBOARD_TRACE is set)
+start_rerun()
+
+# Init session state (the model itself is one shared client per server)
 if 'model' not in st.session_state:
-    st.session_state['model'] = ChatGroq(api_key=st.secrets["GROQ_API_KEY"], model="llama3-70b-8192")
+    st.session_state['model'] = get_llm_client()
+
+# MongoDB: one pooled client per server; indexes and catalog backfill run once per process
+client = get_mongo_client()
+db = client["Wamoproject"]
+wamo_collection = db["CSV"]
+upload_collection = db["CSVUploads"]
+chunk_collection = db["CSVUploadChunks"]
+profile_collection = db["CSVProfiles"]
+outlier_collection = db["CSVOutliers"]
+catalog_collection = db["CSVCatalog"]
+
+@st.cache_resource
+def prepare_collections():
+    ensure_storage_indexes(upload_collection, chunk_collection)
+    profile_collection.create_index("upload_id", unique=True)
+    outlier_collection.create_index([("filename", 1), ("params", 1)], unique=True)
+    ensure_catalog_indexes(catalog_collection)
+    backfill_catalog(catalog_collection, upload_collection)
+    return True
 
-# MongoDB
-client = MongoClient(st.secrets["MONGO_URI"])
-wamo_collection = client["Wamoproject"]["CSV"]
-upload_collection = client["Wamoproject"]["CSVUploads"]
+prepare_collections()
+st.session_state['llm_cache'] = get_llm_cache(db["LLMCache"])
+jobs = get_job_queue(db["Jobs"])
 
 # WAMO lake mapping
 WAMO_MAPPING = {
@@ -56,24 +87,101 @@ st.title("📊 AI Chart Assistant")
 # Utility Functions
 # ---------------------------
 
-def save_uploaded_file(file, df):
-    filename = file.name
-    existing = upload_collection.find_one({"filename": filename})
-    if not existing:
-        upload_collection.insert_one({
-            "filename": filename,
-            "uploaded_at": datetime.datetime.utcnow(),
-            "data": df.to_dict("records")
-        })
+def save_uploaded_file(file, progress=None, append_to=None):
+    # `append_to`: metadata of a stored dataset that receives only the file's new rows
+    if append_to is not None:
+        with span("mongo.append_upload", bytes=getattr(file, "size", None)) as s:
+            status, meta = append_upload(
+                file, append_to, upload_collection, chunk_collection, progress=progress, profile_collection=profile_collection
+            )
+            s.set(status=status, rows=meta.get("last_append", {}).get("rows_added"))
+    else:
+        with span("mongo.ingest_upload", bytes=getattr(file, "size", None)) as s:
+            status, meta = ingest_upload(
+                file, upload_collection, chunk_collection, progress=progress, profile_collection=profile_collection
+            )
+            s.set(status=status, rows=meta.get("row_count"))
+    if status == "stored":
+        get_dataset_cache().invalidate(file.name)
+        get_figure_cache().invalidate(file.name)
+        record_upload(catalog_collection, meta, size_bytes=getattr(file, "size", None))
+        list_uploaded_filenames.clear()
+    elif status == "appended":
+        get_dataset_cache().invalidate(meta["filename"])
+        get_figure_cache().invalidate(meta["filename"])
+        record_upload(catalog_collection, meta)
+        list_uploaded_filenames.clear()
+    return status, meta
 
 def get_uploaded_filenames():
-    return [doc["filename"] for doc in upload_collection.find({}, {"filename": 1})]
+    with span("mongo.list_uploads") as s:
+        filenames = list_uploaded_filenames(catalog_collection)
+        s.set(rows=len(filenames))
+    return filenames
 
-def load_file_from_mongo(filename):
-    doc = upload_collection.find_one({"filename": filename})
-    if doc:
-        return pd.DataFrame(doc["data"])
-    return None
+def load_file_from_mongo(filename, columns=None, rows=None, meta=None):
+    meta = meta or get_dataset_meta(filename, upload_collection)
+    if not meta:
+        return None
+    key = (filename, dataset_version(meta), tuple(columns) if columns else None, rows)
+    with span("load_dataset") as s:
+        df = get_dataset_cache().get_or_load(
+            key,
+            lambda: compact_frame(read_dataset(filename, upload_collection, chunk_collection, columns=columns, rows=rows, meta=meta))
+        )
+        s.set(**frame_stats(df))
+    return df
+
+def load_profile(meta):
+    # None until a profiling job has stored one for this version
+    with span("mongo.load_profile"):
+        return load_stored_profile(meta["_id"], dataset_version(meta), profile_collection)
+
+# ---------------------------
+# Background Jobs
+# ---------------------------
+
+def job_dataset(ctx):
+    # The dataset a job was queued for, as long as that is still the stored version
+    filename, version = ctx.dataset
+    meta = get_dataset_meta(filename, upload_collection)
+    if not meta or dataset_version(meta) != version:
+        raise ValueError("The dataset has changed since this job was queued.")
+    return meta, load_file_from_mongo(filename, meta=meta)
+
+def ingest_job(ctx, filename, append_to, path):
+    try:
+        target = get_dataset_meta(append_to, upload_collection) if append_to else None
+        if append_to and not target:
+            raise ValueError(f"'{append_to}' no longer exists.")
+        # Read from the spooled copy in blocks, like the upload itself
+        with SpooledUpload(path, filename) as file:
+            status, saved = save_uploaded_file(
+                file, progress=lambda rows, fraction: ctx.progress(fraction, f"{rows:,} rows stored"), append_to=target
+            )
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    return {"status": status, "filename": saved["filename"], "row_count": saved.get("row_count"), "last_append": saved.get("last_append")}
+
+def profile_job(ctx):
+    meta, df = job_dataset(ctx)
+    ctx.progress(0.5, "profiling")
+    get_or_compute_profile(meta, dataset_version(meta), df, profile_collection)
+
+def outliers_job(ctx, **params):
+    _, df = job_dataset(ctx)
+    fences = outlier_fences(df, **params, progress=lambda fraction: ctx.progress(fraction, "flagging outliers"))
+    save_fences(ctx.dataset, params, fences, outlier_collection)
+
+jobs.register("ingest", ingest_job)
+jobs.register("profile", profile_job)
+jobs.register("outliers", outliers_job)
+jobs.register("comparison", lambda ctx, **params: tab_compare.summary_job(
+    ctx, job_dataset(ctx)[1], WAMO_MAPPING, wamo_collection, **params
+))
+jobs.register("llm", functools.partial(stream_job, model=st.session_state['model'], cache=st.session_state['llm_cache']))
+jobs.start()
 
 # ---------------------------
 # Sidebar
@@ -87,56 +195,152 @@ with st.sidebar:
     st.markdown("📚 **Previously Uploaded Files**")
     prev_files = get_uploaded_filenames()
     dropdown_options = ["📂 Select a file..."] + prev_files if prev_files else ["No files yet"]
-    selected_prev_file = st.selectbox("🕘 Choose Existing File", dropdown_options)
+    # Keyed so the choice survives the list reordering after an upload or append
+    selected_prev_file = st.selectbox("🕘 Choose Existing File", dropdown_options, key="selected_file")
+    append_mode = st.toggle(
+        "➕ Append uploads to this file",
+        help="Adds only the uploaded rows whose timestamps aren't stored yet, e.g. a station's weekly export.",
+    )
 
 # Block data load unless user explicitly chooses a file
     df = None
+    profile = None
+    meta = None
+    st.session_state['dataset_key'] = None
     if selected_prev_file not in ["📂 Select a file...", "No files yet"]:
-        df = load_file_from_mongo(selected_prev_file)
+        with span("mongo.get_dataset_meta"):
+            meta = get_dataset_meta(selected_prev_file, upload_collection)
+        if meta:
+            # Tabs key their derived results (missing index, flags, ...) on this
+            st.session_state['dataset_key'] = (selected_prev_file, dataset_version(meta))
+            df = load_file_from_mongo(selected_prev_file, meta=meta)
+            profile = load_profile(meta)
+
+    cache_stats = get_dataset_cache().stats()
+    st.caption(
+        f"🗄️ Dataset cache: {cache_stats['entries']} loaded, "
+        f"{cache_stats['bytes'] / 1e6:.0f}/{cache_stats['budget_bytes'] / 1e6:.0f} MB, "
+        f"hit rate {cache_stats['hit_rate']:.0%}"
+    )
+    figure_stats = get_figure_cache().stats()
+    st.caption(
+        f"🖼️ Figure cache: {figure_stats['entries']} figures, "
+        f"{figure_stats['bytes'] / 1e6:.1f}/{figure_stats['budget_bytes'] / 1e6:.0f} MB, "
+        f"hit rate {figure_stats['hit_rate']:.0%}"
+    )
+    llm_stats = st.session_state['llm_cache'].stats()
+    st.caption(
+        f"🧠 LLM cache: {llm_stats['entries']} stored, "
+        f"{llm_stats['hits']}/{llm_stats['hits'] + llm_stats['misses']} hits ({llm_stats['hit_rate']:.0%})"
+    )
+    health = mongo_health(client)
+    pool = get_mongo_metrics().snapshot()
+    st.caption(
+        (f"🟢 MongoDB {health['latency_ms']:.0f} ms" if health["ok"] else "🔴 MongoDB unreachable")
+        + f" · {pool['connections_open']} connections, {pool['checked_out']} in use, "
+        f"{pool['commands']} commands (avg {pool['avg_command_ms']:.1f} ms)"
+    )
 
 # ---------------------------
 # Upload Handling (save only)
 # ---------------------------
 
-if uploaded_file:
-    try:
-        if uploaded_file.name.endswith(".csv"):
-            temp_df = pd.read_csv(uploaded_file)
-        else:
-            temp_df = pd.read_excel(uploaded_file)
+if 'ingested_uploads' not in st.session_state:
+    st.session_state['ingested_uploads'] = set()
 
-        save_uploaded_file(uploaded_file, temp_df)
-        st.success(f"✅ '{uploaded_file.name}' uploaded successfully.")
-        st.info("📌 Please select the uploaded file from the dropdown below to view it.")
-    except Exception as e:
-        st.error(f"❌ Failed to load file: {e}")
-        st.stop()
+if 'upload_notice' in st.session_state:
+    st.success(st.session_state.pop('upload_notice'))
 
-# ---------------------------
-# Load Selected File (user-driven)
-# ---------------------------
+append_target = meta if append_mode and meta else None
+upload_token = (
+    (uploaded_file.name, uploaded_file.size, getattr(uploaded_file, "file_id", None), append_target and append_target["filename"])
+    if uploaded_file else None
+)
+if uploaded_file and upload_token not in st.session_state['ingested_uploads']:
+    # Ingestion runs as a background job; the rest of the page stays usable while it runs
+    upload_jobs = st.session_state.setdefault('upload_jobs', {})
+    if upload_token not in upload_jobs:
+        # Keyed on the spooled copy, which only this host's workers can read; ingestion itself spots a repeated upload
+        params = {
+            "filename": uploaded_file.name,
+            "append_to": append_target and append_target["filename"],
+            "path": spool_upload(uploaded_file),
+        }
+        upload_jobs[upload_token] = jobs.submit("ingest", (uploaded_file.name, None), params, local=True)
 
-df = None
-if selected_prev_file and selected_prev_file != "No files yet":
-    df = load_file_from_mongo(selected_prev_file)
+    job = wait_for_job(jobs, upload_jobs[upload_token], f"Ingesting '{uploaded_file.name}'")
+    if job is not None:
+        st.session_state['ingested_uploads'].add(upload_token)
+        saved = job.get("result") or {}
+        status = saved.get("status")
+        if job["status"] == "cancelled":
+            # A job cancelled before a worker claimed it never cleaned up its spooled copy
+            if os.path.exists(job["params"]["path"]):
+                os.remove(job["params"]["path"])
+            st.info(f"✖️ Upload of '{uploaded_file.name}' was cancelled.")
+        elif job["status"] != "done":
+            st.error(f"❌ Failed to load file: {job.get('error')}")
+        elif status == "duplicate":
+            st.info(f"ℹ️ This file was already {'added to' if append_target else 'uploaded as'} '{saved['filename']}'.")
+        elif status == "appended":
+            appended = saved["last_append"]
+            st.session_state['upload_notice'] = (
+                f"✅ Appended {appended['rows_added']:,} new rows to '{saved['filename']}' "
+                f"({appended['rows_skipped']:,} already stored or without a timestamp)."
+            )
+            # The dataset above was loaded before the append; reload it at the new version
+            st.rerun()
+        else:
+            st.success(f"✅ '{uploaded_file.name}' uploaded successfully ({saved['row_count']:,} rows).")
+            st.info("📌 Please select the uploaded file from the dropdown below to view it.")
 
 # ---------------------------
 # Main Tabs UI
 # ---------------------------
 
-if df is not None:
-    tab1, tab2, tab3, tab4 = st.tabs(["🔍 Preview Data", "📊 Suggested Charts", "📋 Compare with WAMO", "💬 Chat with Assistant"])
+profiling = False
+if df is not None and profile is None:
+    # Datasets stored before profiles were kept at ingestion are profiled once, in the background
+    job = wait_for_job(jobs, jobs.submit("profile", st.session_state['dataset_key']), "📐 Profiling the dataset")
+    # Tabs render once the profile lands
+    profiling = job is None
+    if job is not None:
+        profile = load_profile(meta)
+        if job["status"] != "done":
+            # The failed job is kept until retried; meanwhile the tabs use a profile computed here
+            col_warning, col_retry = st.columns([4, 1])
+            col_warning.warning(f"⚠️ Background profiling did not finish: {job.get('error') or job['status']}")
+            if col_retry.button("🔄 Retry profiling", key="retry_profile"):
+                jobs.submit("profile", st.session_state['dataset_key'], refresh=True)
+                st.rerun()
+            profile = profile or cached_derived("profile", lambda: compute_profile(df))
+
+if df is not None and not profiling:
+    # Stateful tabs: only the selected tab's body runs (and spends LLM calls) on a rerun
+    tab1, tab2, tab3, tab4 = st.tabs(
+        ["🔍 Preview Data", "📊 Suggested Charts", "📋 Compare with WAMO", "💬 Chat with Assistant"],
+        key="active_tab",
+        on_change="rerun"
+    )
 
-    with tab1:
-        tab_preview.render(df)
+    if tab1.open:
+        with tab1:
+            tab_preview.render(df, profile, jobs, outlier_collection)
 
-    with tab2:
-        tab_charts.render(df)
+    if tab2.open:
+        with tab2:
+            tab_charts.render(df, profile)
 
-    with tab3:
-        tab_compare.render(df, selected_lake, WAMO_MAPPING, wamo_collection)
+    if tab3.open:
+        with tab3:
+            tab_compare.render(df, selected_lake, WAMO_MAPPING, wamo_collection, jobs)
 
-    with tab4:
-        tab_chat.render(df)
-else:
+    if tab4.open:
+        with tab4:
+            tab_chat.render(df, meta, upload_collection, chunk_collection)
+elif not profiling:
     st.info("📁 Please select a file from the dropdown or upload a new one.")
+
+finish_rerun()
+with st.sidebar:
+    render_trace_panel()
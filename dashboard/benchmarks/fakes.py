@@ -0,0 +1,228 @@
+# ----------------------------
+# File: benchmarks/fakes.py
+# ----------------------------
+# Local stand-ins so the benchmarks exercise the real code paths without a
+# MongoDB server or Groq: a small in-memory Mongo covering the calls the
+# dashboard makes, and a deterministic chat model with configurable latency.
+import hashlib
+import time
+
+import bson
+from bson import ObjectId
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pymongo.results import InsertOneResult
+
+
+def _matches(doc, query):
+    for field, condition in query.items():
+        value = doc.get(field)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+            continue
+        for op, operand in condition.items():
+            if op == "$ne":
+                ok = value != operand
+            elif op == "$in":
+                ok = value in operand
+            elif value is None:
+                ok = False
+            elif op == "$lt":
+                ok = value < operand
+            elif op == "$lte":
+                ok = value <= operand
+            elif op == "$gt":
+                ok = value > operand
+            elif op == "$gte":
+                ok = value >= operand
+            else:
+                raise NotImplementedError(f"Query operator {op} is not supported by the benchmark store")
+            if not ok:
+                return False
+    return True
+
+
+def _project(doc, projection):
+    if not projection:
+        return dict(doc)
+    include_id = projection.get("_id", 1)
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if fields and all(fields.values()):
+        out = {k: doc[k] for k in fields if k in doc}
+        if include_id and "_id" in doc:
+            out = {"_id": doc["_id"], **out}
+        return out
+    out = {k: v for k, v in doc.items() if k not in fields}
+    if not include_id:
+        out.pop("_id", None)
+    return out
+
+
+class InMemoryCursor:
+    def __init__(self, collection, docs, projection):
+        self._collection = collection
+        self._docs = docs
+        self._projection = projection
+        self._limit = 0
+
+    def sort(self, key, direction=1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, order in reversed(keys):
+            # None sorts first, like Mongo's ordering of missing values
+            self._docs.sort(key=lambda d: (d.get(field) is not None, d.get(field)), reverse=order < 0)
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def __iter__(self):
+        docs = self._docs[:self._limit] if self._limit else self._docs
+        for doc in docs:
+            yield self._collection._wire(_project(doc, self._projection))
+
+
+class InMemoryCollection:
+    """Just enough of pymongo's Collection for the dashboard. Documents cross a BSON
+    encode/decode on the way in and out, as they would over the wire, and
+    `bytes_returned` counts the BSON sent back to the caller. Indexes are no-ops."""
+
+    def __init__(self, full_name):
+        self.full_name = full_name
+        self._docs = {}
+        self.bytes_returned = 0
+
+    def _wire(self, doc):
+        raw = bson.encode(doc)
+        self.bytes_returned += len(raw)
+        return bson.decode(raw)
+
+    def create_index(self, keys, **kwargs):
+        return keys if isinstance(keys, str) else "_".join(f"{k}_{v}" for k, v in keys)
+
+    def insert_one(self, doc):
+        doc.setdefault("_id", ObjectId())
+        self._docs[doc["_id"]] = bson.decode(bson.encode(doc))
+        return InsertOneResult(doc["_id"], True)
+
+    def insert_many(self, docs):
+        for doc in docs:
+            self.insert_one(doc)
+
+    def _matching(self, query):
+        return [doc for doc in self._docs.values() if _matches(doc, query or {})]
+
+    def find(self, query=None, projection=None, batch_size=None, **kwargs):
+        return InMemoryCursor(self, self._matching(query), projection)
+
+    def find_one(self, query=None, projection=None, sort=None):
+        cursor = self.find(query, projection)
+        if sort:
+            cursor.sort(sort)
+        return next(iter(cursor.limit(1)), None)
+
+    def update_one(self, query, update, upsert=False):
+        doc = next(iter(self._matching(query)), None)
+        if doc is None:
+            if not upsert:
+                return
+            doc = {k: v for k, v in query.items() if not isinstance(v, dict)}
+            doc["_id"] = doc.get("_id", ObjectId())
+            self._docs[doc["_id"]] = doc
+        for field, value in update.get("$set", {}).items():
+            doc[field] = bson.decode(bson.encode({"v": value}))["v"]
+        for field, value in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + value
+
+    def replace_one(self, query, replacement, upsert=False):
+        doc = next(iter(self._matching(query)), None)
+        if doc is None and not upsert:
+            return
+        _id = doc["_id"] if doc else replacement.get("_id", ObjectId())
+        self._docs[_id] = bson.decode(bson.encode({**replacement, "_id": _id}))
+
+    def delete_one(self, query):
+        doc = next(iter(self._matching(query)), None)
+        if doc is not None:
+            del self._docs[doc["_id"]]
+
+    def delete_many(self, query):
+        for doc in self._matching(query):
+            del self._docs[doc["_id"]]
+
+    def count_documents(self, query):
+        return len(self._matching(query))
+
+    def estimated_document_count(self):
+        return len(self._docs)
+
+
+class InMemoryDatabase:
+    def __init__(self, name):
+        self.name = name
+        self._collections = {}
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = InMemoryCollection(f"{self.name}.{name}")
+        return self._collections[name]
+
+
+class InMemoryClient:
+    def __init__(self):
+        self._databases = {}
+
+    def __getitem__(self, name):
+        if name not in self._databases:
+            self._databases[name] = InMemoryDatabase(name)
+        return self._databases[name]
+
+
+def in_memory_mongo(backend="memory"):
+    if backend == "mongomock":
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("--mongo mongomock needs mongomock installed (pip install mongomock)")
+        return mongomock.MongoClient()
+    return InMemoryClient()
+
+
+def chart_response(x, y):
+    return (
+        f"Here are three charts.\n"
+        f"```python\nfig = px.line(df, x=\"{x}\", y=\"{y}\", title=\"{y} over {x}\")\n```\n"
+        f"```python\nfig = px.histogram(df, x=\"{y}\", nbins=50)\n```\n"
+        f"```python\nfig = px.box(df, y=\"{y}\")\n```"
+    )
+
+
+class FakeChatModel(BaseChatModel):
+    """Returns `response` for every prompt, after `latency_s` and with `chunk_delay_s` between streamed words."""
+
+    response: str = "OK"
+    latency_s: float = 0.0
+    chunk_delay_s: float = 0.0
+    model_name: str = "fake-benchmark"
+
+    @property
+    def _llm_type(self):
+        return "fake-benchmark"
+
+    def _reply(self, messages):
+        # Deterministic per prompt, so the LLM cache sees stable keys
+        digest = hashlib.sha1("".join(str(m.content) for m in messages).encode("utf-8")).hexdigest()[:8]
+        return f"{self.response}\n\n(ref {digest})"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        reply = self._reply(messages)
+        time.sleep(self.latency_s + self.chunk_delay_s * len(reply.split(" ")))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency_s)
+        for word in self._reply(messages).split(" "):
+            time.sleep(self.chunk_delay_s)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
@@ -0,0 +1,334 @@
+# ----------------------------
+# File: benchmarks/run.py
+# ----------------------------
+# Scaling benchmarks for the dashboard's data paths, run outside Streamlit
+# against an in-memory Mongo and a fake chat model. From the dashboard directory:
+#
+#   python -m benchmarks.run                          # 10k and 100k rows
+#   python -m benchmarks.run --sizes 10k,100k,1M,10M  # 10M needs a lot of RAM
+#   python -m benchmarks.run --update-baseline        # accept current numbers
+#   python -m benchmarks.run --executor process       # chart workers as under `streamlit run`
+#
+# Every step reports wall time, peak resident memory growth (sampled from
+# /proc, so Arrow and NumPy buffers count) and, where a figure or payload is
+# produced, its size in bytes. Results are compared with
+# benchmarks/baseline.json and the exit status is 1 on a regression.
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import threading
+import time
+import types
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+DEFAULT_SIZES = "10k,100k"
+WARMUP_ROWS = 2_000
+# One week of 15-minute readings, the size of a weekly station export
+APPEND_ROWS = 672
+RSS_SAMPLE_S = 0.005
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+# Differences below these are noise, whatever the ratio
+MIN_REGRESSION_SECONDS = 0.05
+MIN_REGRESSION_MB = 5
+APP_PATH = os.path.join(os.path.dirname(BENCH_DIR), "app.py")
+LAKE = "Babenhäuser See"
+WAMO_MAPPING = {LAKE: "wamo00023"}
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    factor = {"k": 1_000, "m": 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip("km")) * factor)
+
+
+def size_label(rows):
+    return f"{rows // 1_000_000}M" if rows >= 1_000_000 else f"{rows // 1_000}k"
+
+
+def _rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class RssSampler:
+    """Peak RSS above the starting point while the block runs; 0 where /proc is unavailable."""
+
+    def __enter__(self):
+        self.enabled = os.path.exists("/proc/self/statm")
+        self.peak = 0
+        if self.enabled:
+            self.start = _rss_bytes()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_bytes() - self.start)
+            self._stop.wait(RSS_SAMPLE_S)
+
+    def __exit__(self, *exc):
+        if self.enabled:
+            self._stop.set()
+            self._thread.join()
+            self.peak = max(self.peak, _rss_bytes() - self.start)
+
+
+class Recorder:
+    def __init__(self, quiet=False):
+        self.quiet = quiet
+        self.results = {}
+
+    def measure(self, step, fn, payload=None):
+        """Run `fn()` once, recording time, peak memory and `payload(result)` bytes if given."""
+        with RssSampler() as memory:
+            started = time.perf_counter()
+            result = fn()
+            seconds = time.perf_counter() - started
+        entry = {"seconds": round(seconds, 4), "peak_mb": round(memory.peak / 1e6, 2)}
+        if payload is not None:
+            entry["payload_bytes"] = payload(result)
+        self.results[step] = entry
+        if not self.quiet:
+            print(f"  {step:<22} {seconds:9.3f}s {entry['peak_mb']:10.1f} MB"
+                  + (f" {entry['payload_bytes']:>12,} B" if payload is not None else ""), flush=True)
+        return result
+
+
+def figure_bytes(fig):
+    return len(fig.to_json()) if fig is not None else 0
+
+
+def run_size(rows, args, quiet=False):
+    # Imported here so CHART_EXECUTOR and the fake model are in place before the modules read them
+    import pandas as pd
+    import streamlit as st
+    from langchain_core.messages import HumanMessage
+
+    from benchmarks import synthetic
+    from benchmarks.fakes import FakeChatModel, chart_response, in_memory_mongo
+    from tabs.tab_compare import find_date_column
+    from utils.catalog import ensure_catalog_indexes, record_upload
+    from utils.chart_executor import get_fig_from_code
+    from utils.compact import compact_frame
+    from utils.comparison import align_datasets, comparison_stats
+    from utils.dataset_cache import DatasetCache
+    from utils.distribution import distribution_figure
+    from utils.downsample import downsample_indices
+    from utils.ingest import append_upload, ingest_upload
+    from utils.llm_orchestrator import stream_prompts
+    from utils.missing_index import build_missing_index
+    from utils.mongo_utils import fetch_wamo_df, normalize_columns
+    from utils.outliers import outlier_fences, outlier_view
+    from utils.profile import compute_profile
+    from utils.prompt_context import build_digest
+    from utils.storage import dataset_version, ensure_storage_indexes, get_dataset_meta, read_dataset
+
+    if not quiet:
+        print(f"\n▶ {size_label(rows)} rows", flush=True)
+    recorder = Recorder(quiet)
+    db = in_memory_mongo(args.mongo)["Benchmark"]
+    uploads, chunks, catalog, wamo = db["CSVUploads"], db["CSVUploadChunks"], db["CSVCatalog"], db["CSV"]
+    profiles = db["CSVProfiles"]
+    ensure_storage_indexes(uploads, chunks)
+    ensure_catalog_indexes(catalog)
+
+    # The last week overlaps the stored rows; the week after it is new
+    manual = synthetic.manual_frame(rows + APPEND_ROWS)
+    upload = synthetic.manual_csv(manual.head(rows))
+    weekly = synthetic.manual_csv(manual.iloc[rows - APPEND_ROWS:], name="benchmark_weekly.csv")
+    del manual
+    for batch in synthetic.wamo_documents(rows):
+        wamo.insert_many(batch)
+
+    # app.save_uploaded_file: streaming ingest, then the catalog entry
+    def save():
+        status, meta = ingest_upload(upload, uploads, chunks, profile_collection=profiles)
+        record_upload(catalog, meta, size_bytes=upload.size)
+        return meta
+
+    meta = recorder.measure("save_upload", save, payload=lambda _: upload.size)
+
+    # app.load_file_from_mongo: cold read through the dataset cache, then a cache hit
+    cache = DatasetCache(8 * 1024 ** 3)
+    filename = meta["filename"]
+    key = (filename, dataset_version(meta), None, None)
+    load = lambda: cache.get_or_load(key, lambda: compact_frame(read_dataset(filename, uploads, chunks, meta=get_dataset_meta(filename, uploads))))
+    df = recorder.measure("load_dataset", load, payload=lambda frame: int(frame.memory_usage(deep=True).sum()))
+    recorder.measure("load_dataset_cached", load)
+
+    # tab_compare: windowed, projected sensor fetch, then alignment and statistics
+    manual_df = normalize_columns(df.copy(deep=False))
+    date_col = find_date_column(manual_df)
+    dates = pd.to_datetime(manual_df[date_col])
+    pad = pd.Timedelta("30min")
+    numeric = [col for col in manual_df.columns if pd.api.types.is_numeric_dtype(manual_df[col])]
+    # Payload is the BSON returned by the store where it can tell, else the frame size
+    returned_before = getattr(wamo, "bytes_returned", None)
+    wamo_df = recorder.measure(
+        "fetch_wamo_df",
+        lambda: normalize_columns(fetch_wamo_df(LAKE, WAMO_MAPPING, wamo, start=dates.min() - pad, end=dates.max() + pad, columns=numeric)),
+        payload=lambda frame: (
+            wamo.bytes_returned - returned_before if returned_before is not None else int(frame.memory_usage(deep=True).sum())
+        ),
+    )
+    wamo_date = find_date_column(wamo_df)
+    shared = [col for col in numeric if col in wamo_df.columns]
+
+    def compare():
+        aligned = align_datasets(manual_df, wamo_df, date_col, wamo_date, shared, tolerance="30min")
+        return comparison_stats(aligned, shared)
+
+    recorder.measure("compare_merge", compare)
+
+    # tab_preview: profile statistics, missing-value index, outlier flags, distribution figure
+    profile = recorder.measure("preview_profile", lambda: compute_profile(df))
+    recorder.measure("preview_missing", lambda: build_missing_index(df, profile["time"]["column"] if profile.get("time") else None))
+    numeric_cols = [c["name"] for c in profile["columns"] if c.get("numeric")]
+    time_col = find_date_column(df)
+
+    def outliers():
+        fences = outlier_fences(df, time_col, numeric_cols)
+        for col in numeric_cols:
+            view = outlier_view(fences, df, time_col, col)
+            downsample_indices(view[time_col], view[col], keep_mask=view["is_outlier"])
+
+    recorder.measure("preview_outliers", outliers)
+    recorder.measure(
+        "distribution_figure",
+        lambda: distribution_figure(df[numeric_cols[0]].dropna().to_numpy(dtype="float64"), numeric_cols[0], "#8ab6f9"),
+        payload=figure_bytes,
+    )
+
+    # Chart code as the LLM would suggest it, through the configured executor
+    st.session_state["dataset_key"] = (filename, dataset_version(meta))
+    code = f'fig = px.line(df, x="{time_col}", y="{numeric_cols[0]}")'
+    fig = recorder.measure("get_fig_from_code", lambda: get_fig_from_code(code, df), payload=figure_bytes)
+    if fig is None:
+        raise RuntimeError(f"Chart code failed under the {args.executor} executor.")
+    recorder.measure("get_fig_from_code_cached", lambda: get_fig_from_code(code, df))
+
+    # Prompt building plus three concurrent streamed insights against the fake model
+    st.session_state["model"] = FakeChatModel(
+        response=chart_response(time_col, numeric_cols[0]), latency_s=args.latency, chunk_delay_s=args.chunk_delay
+    )
+    st.session_state["llm_cache"] = None
+
+    def prompts():
+        digest = build_digest(df, profile)
+        jobs = {i: [HumanMessage(content=f"Insight {i}:\n{digest}")] for i in range(3)}
+        stream_prompts(jobs, {i: st.empty() for i in jobs})
+        return digest
+
+    recorder.measure("llm_prompts", prompts, payload=lambda digest: len(digest.encode("utf-8")))
+
+    # app.save_uploaded_file in append mode: should cost the same at every size
+    recorder.measure(
+        "append_upload",
+        lambda: append_upload(weekly, get_dataset_meta(filename, uploads), uploads, chunks, profile_collection=profiles),
+        payload=lambda _: weekly.size,
+    )
+    return recorder.results
+
+
+def compare_with_baseline(results, baseline, time_tolerance, memory_tolerance):
+    """Lines describing regressions of `results` against `baseline` (same sizes and steps only)."""
+    regressions = []
+    for size, steps in results.items():
+        for step, current in steps.items():
+            previous = baseline.get(size, {}).get(step)
+            if not previous:
+                continue
+            if current["seconds"] > MIN_REGRESSION_SECONDS and current["seconds"] > previous["seconds"] * time_tolerance:
+                regressions.append(f"{size} {step}: {previous['seconds']:.3f}s → {current['seconds']:.3f}s")
+            if current["peak_mb"] - previous["peak_mb"] > MIN_REGRESSION_MB and current["peak_mb"] > previous["peak_mb"] * memory_tolerance:
+                regressions.append(f"{size} {step}: {previous['peak_mb']:.1f} MB → {current['peak_mb']:.1f} MB")
+            if previous.get("payload_bytes") and current.get("payload_bytes", 0) > previous["payload_bytes"] * memory_tolerance:
+                regressions.append(f"{size} {step}: {previous['payload_bytes']:,} B → {current['payload_bytes']:,} B payload")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dashboard scaling benchmarks")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated row counts, e.g. 10k,100k,1M,10M")
+    parser.add_argument("--executor", choices=["inline", "process"], default="inline", help="chart code executor")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake model time to first token (s)")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="fake model delay per streamed word (s)")
+    parser.add_argument("--mongo", choices=["memory", "mongomock"], default="memory", help="Mongo stand-in")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="write these results as the new baseline")
+    parser.add_argument("--output", help="also write the results JSON here")
+    parser.add_argument("--time-tolerance", type=float, default=1.5)
+    parser.add_argument("--memory-tolerance", type=float, default=1.3)
+    args = parser.parse_args(argv)
+
+    os.environ["CHART_EXECUTOR"] = args.executor
+    if args.executor == "process":
+        # `streamlit run` registers the script as __main__; chart workers must start without importing it
+        streamlit_main = types.ModuleType("__main__")
+        streamlit_main.__file__ = APP_PATH
+        sys.modules["__main__"] = streamlit_main
+    # Streamlit warns about the missing script context on every call outside `streamlit run`,
+    # and resets its log levels once its config loads, so silence its loggers outright
+    import streamlit  # noqa: F401  (registers the loggers)
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).disabled = True
+
+    # One small untimed pass so imports and first-call setup don't land in the smallest size
+    run_size(WARMUP_ROWS, args, quiet=True)
+    results = {}
+    for rows in sorted(parse_size(size) for size in args.sizes.split(",")):
+        results[size_label(rows)] = run_size(rows, args)
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "executor": args.executor,
+        "mongo": args.mongo,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update({k: v for k, v in report.items() if k != "results"})
+        baseline.setdefault("results", {}).update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\n💾 Baseline updated: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("\nℹ️ No baseline yet; run with --update-baseline to record one.")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("executor", args.executor) != args.executor:
+        print(f"\nℹ️ The baseline was recorded with the {baseline['executor']} executor; timings not compared.")
+        return 0
+    regressions = compare_with_baseline(
+        results, baseline.get("results", {}), args.time_tolerance, args.memory_tolerance
+    )
+    if regressions:
+        print("\n🚨 Regressions against the baseline:")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    print("\n✅ No regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+# ----------------------------
+# File: benchmarks/synthetic.py
+# ----------------------------
+# Deterministic synthetic water-quality data for the benchmarks: a manual
+# station export (CSV bytes, like an upload) and WAMO sensor documents, with
+# diurnal cycles, timestamp jitter, sensor dropouts, missing rows and spikes.
+import datetime
+import io
+
+import numpy as np
+import pandas as pd
+
+MANUAL_INTERVAL = "15min"
+WAMO_INTERVAL = "10min"
+START = pd.Timestamp("2022-01-01")
+
+# name: (base level, diurnal amplitude, noise std, outlier spike size)
+PARAMETERS = {
+    "pH": (7.6, 0.3, 0.05, 3.0),
+    "Temperature": (14.0, 3.0, 0.3, 25.0),
+    "Dissolved Oxygen": (8.5, 1.5, 0.2, 10.0),
+    "Turbidity": (3.0, 0.8, 0.5, 40.0),
+    "Conductivity": (450.0, 20.0, 5.0, 600.0),
+}
+
+
+def _signal(rng, n, hours, base, amplitude, noise):
+    diurnal = amplitude * np.sin(2 * np.pi * (hours % 24) / 24)
+    seasonal = amplitude * 0.5 * np.sin(2 * np.pi * hours / (24 * 365))
+    return base + diurnal + seasonal + rng.normal(0, noise, n)
+
+
+def _timestamps(rng, n, interval, jitter_s):
+    step = pd.Timedelta(interval).total_seconds()
+    offsets = np.arange(n) * step + rng.uniform(-jitter_s, jitter_s, n)
+    return START + pd.to_timedelta(np.sort(offsets), unit="s")
+
+
+def _add_gaps(rng, values, gap_count, max_gap):
+    starts = rng.integers(0, len(values), gap_count)
+    lengths = rng.integers(1, max_gap, gap_count)
+    for start, length in zip(starts, lengths):
+        values[start:start + length] = np.nan
+
+
+def manual_frame(rows, seed=0):
+    """Manual station data: jittered 15-minute readings, dropouts, dropped rows and spikes."""
+    rng = np.random.default_rng(seed)
+    # Generate ~3% extra rows, then drop some to leave holes in the time axis
+    n = int(rows * 1.03)
+    times = _timestamps(rng, n, MANUAL_INTERVAL, jitter_s=90)
+    hours = (times - START).total_seconds().to_numpy() / 3600
+    data = {"Date": times}
+    for name, (base, amplitude, noise, spike) in PARAMETERS.items():
+        values = _signal(rng, n, hours, base, amplitude, noise)
+        _add_gaps(rng, values, max(1, n // 5_000), max_gap=200)
+        spikes = rng.random(n) < 0.002
+        values[spikes] += spike * rng.choice([-1, 1], spikes.sum()) * rng.uniform(0.5, 1.0, spikes.sum())
+        data[name] = np.round(values, 3)
+    df = pd.DataFrame(data)
+    keep = np.sort(rng.choice(n, rows, replace=False))
+    return df.iloc[keep].reset_index(drop=True)
+
+
+def manual_csv(df, name="benchmark_manual.csv"):
+    """CSV bytes in the shape of a Streamlit UploadedFile (seekable, with `name` and `size`)."""
+    buffer = io.BytesIO(df.to_csv(index=False, date_format="%d.%m.%Y %H:%M").encode("utf-8"))
+    buffer.name = name
+    buffer.size = buffer.getbuffer().nbytes
+    return buffer
+
+
+def wamo_documents(rows, wamo_id="wamo00023", seed=1, batch_rows=100_000):
+    """WAMO sensor documents in batches, as stored in the `CSV` collection (datetime timestamps)."""
+    rng = np.random.default_rng(seed)
+    times = _timestamps(rng, rows, WAMO_INTERVAL, jitter_s=20)
+    hours = (times - START).total_seconds().to_numpy() / 3600
+    columns = {}
+    for name, (base, amplitude, noise, spike) in PARAMETERS.items():
+        # Sensors read slightly offset from the manual values
+        values = _signal(rng, rows, hours, base * 1.02, amplitude, noise * 1.5)
+        _add_gaps(rng, values, max(1, rows // 10_000), max_gap=500)
+        columns[name] = np.round(values, 3)
+    py_times = times.to_pydatetime()
+    for start in range(0, rows, batch_rows):
+        stop = min(start + batch_rows, rows)
+        batch = []
+        for i in range(start, stop):
+            doc = {"wamo_id": wamo_id, "Timestamp": py_times[i]}
+            for name, values in columns.items():
+                value = values[i]
+                if not np.isnan(value):
+                    doc[name] = float(value)
+            batch.append(doc)
+        yield batch
+
+
+def time_span(df, time_col="Date"):
+    times = pd.to_datetime(df[time_col])
+    return times.min().to_pydatetime(), times.max().to_pydatetime() + datetime.timedelta(minutes=15)
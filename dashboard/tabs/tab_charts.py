@@ -7,9 +7,61 @@ import re
 import plotly.express as px
 import pandas as pd
 from utils.chart_executor import get_fig_from_code
+from utils.llm_cache import cached_invoke
+from utils.llm_orchestrator import stream_prompts
+from utils.downsample import downsample_frame, WEBGL_THRESHOLD
+from utils.profile import compute_profile, profile_prompt_sections
+from utils.prompt_context import build_digest
+from utils.dataset_cache import cached_derived
+from utils.figure_cache import cached_figure
 from langchain_core.messages import HumanMessage
-
-def render(df):
+from utils.tracing import plotly_chart
+
+def _manual_figure(df, x_axis, y_axis, chart_type):
+    # Line/scatter payloads are capped to a point budget; bars keep every category
+    plot_df = df
+    if chart_type in ("Line", "Scatter") and pd.api.types.is_numeric_dtype(df[y_axis]):
+        plot_df = downsample_frame(df, x_axis, [y_axis])
+    render_mode = "webgl" if len(plot_df) > WEBGL_THRESHOLD else "auto"
+    if chart_type == "Line":
+        fig = px.line(plot_df, x=x_axis, y=y_axis, title=f"{y_axis} over {x_axis}", render_mode=render_mode)
+    elif chart_type == "Scatter":
+        fig = px.scatter(plot_df, x=x_axis, y=y_axis, title=f"{y_axis} vs {x_axis}", render_mode=render_mode)
+    else:
+        fig = px.bar(df, x=x_axis, y=y_axis, title=f"{y_axis} by {x_axis}")
+    return fig
+
+
+# Submitting the form re-executes only this fragment, not the AI suggestions
+@st.fragment
+def _manual_chart_builder(df):
+    st.subheader("🎛️ Build Your Own Chart")
+
+    with st.form("manual_chart_form"):
+        columns = df.columns.tolist()
+        x_axis = st.selectbox("📈 X-axis", columns)
+        y_axis = st.selectbox("📉 Y-axis", columns)
+        chart_type = st.selectbox("📊 Chart Type", ["Line", "Scatter", "Bar"])
+        submit = st.form_submit_button("Generate Chart")
+    if submit:
+        st.session_state["manual_chart"] = (x_axis, y_axis, chart_type)
+    # The last submitted chart stays up on later reruns, served from the figure cache
+    params = st.session_state.get("manual_chart")
+    if params and params[0] in df.columns and params[1] in df.columns:
+        x_axis, y_axis, chart_type = params
+        if chart_type not in ("Line", "Scatter", "Bar"):
+            st.warning("Unsupported chart type.")
+            return
+        try:
+            fig = cached_figure("manual", params, lambda: _manual_figure(df, x_axis, y_axis, chart_type))
+            plotly_chart(fig, width="stretch")
+        except Exception as e:
+            st.error(f"⚠️ Error generating manual chart: {e}")
+            if st.button("🔁 Retry Generating Chart", key=f"retry_button_{hash((x_axis, y_axis, chart_type))}"):
+                st.rerun()
+
+
+def render(df, profile=None):
     st.subheader("📊 Chart Exploration")
 
     # Toggle: AI vs Manual
@@ -20,9 +72,12 @@ def render(df):
     )
 
     if mode == "AI Suggestions":
+        refresh_insights = st.button("🔄 Regenerate Insights", key="refresh_insights")
+        # Token-budgeted digest of the whole dataset, shared by the suggestion and insight prompts
+        digest = cached_derived("prompt_digest", lambda: build_digest(df, profile))
         if "chart_suggestions" not in st.session_state:
-            df_preview = df.head(100).to_string(index=False)
             column_list = ", ".join(df.columns.tolist())
+            sections = profile_prompt_sections(profile or compute_profile(df))
 
             # Dynamically detect appropriate example x and y
             datetime_col = next((col for col in df.columns if pd.api.types.is_datetime64_any_dtype(df[col]) or 'date' in col.lower() or 'time' in col.lower()), None)
@@ -38,7 +93,7 @@ fig = px.line(df, x="{example_x}", y="{example_y}", title="{example_y} over {exa
             suggestion_prompt = f"""
 You are an AI assistant helping a water scientist explore a water quality dataset.
 
-🎯 Based on the first 100 rows of this dataset, suggest exactly **3 insightful and relevant charts** using Plotly Express.
+🎯 Based on the dataset digest below, suggest exactly **3 insightful and relevant charts** using Plotly Express.
 
 ✅ Only use the columns listed below exactly as they are:
 {column_list}
@@ -54,27 +109,35 @@ Requirements:
 - Use **different chart types** where possible
 - Avoid generic or repeated chart types
 - Use columns present in the dataset
+- Prefer parameters with real variation over flat columns
+
+Column statistics (full dataset):
+{sections["stats"]}
+
+Low-variance columns: {sections["low_variance"]}
+Timestamps: {sections["timing"]}
 
-Data Preview:
-{df_preview}
+Dataset digest:
+{digest}
 """
 
-            response = st.session_state["model"].invoke([
+            response = cached_invoke([
                 HumanMessage(content=suggestion_prompt)
-            ])
+            ], label="chart_suggestions")
 
             code_blocks = re.findall(r"```(?:[Pp]ython)?(.*?)```", response.content, re.DOTALL)[:3]
             st.session_state["chart_suggestions"] = code_blocks
 
-        # Render AI-suggested charts with collapsible insights
+        # Render AI-suggested charts first, then stream all insights concurrently
+        insight_jobs = {}
+        insight_placeholders = {}
         for i, code in enumerate(st.session_state["chart_suggestions"]):
             fig = get_fig_from_code(code.strip(), df)
             if fig:
                 st.subheader(f"Suggested Chart #{i + 1}")
-                st.plotly_chart(fig, use_container_width=True)
+                plotly_chart(fig, width="stretch")
 
                 # Generate insight explanation
-                df_preview = df.head(100).to_string(index=False)
                 explanation_prompt = f"""
 You are a water quality researcher. Below is a chart generated from a dataset.
 
@@ -83,8 +146,8 @@ The chart was created using this code:
 {code.strip()}
 ```
 
-The first 100 rows of the DataFrame `df` look like this:
-{df_preview}
+A digest of the full DataFrame `df`:
+{digest}
 
 Please provide an insightful explanation of what the chart shows:
 - Focus on patterns, anomalies, or relationships in the data
@@ -92,35 +155,12 @@ Please provide an insightful explanation of what the chart shows:
 - Keep it relevant to environmental water analysis
 """
 
-                insight = st.session_state["model"].invoke([
-                    HumanMessage(content=explanation_prompt)
-                ])
-
+                insight_jobs[i] = [HumanMessage(content=explanation_prompt)]
                 with st.expander("🧠 Chart Insight"):
-                    st.markdown(insight.content)
+                    insight_placeholders[i] = st.empty()
+
+        if insight_jobs:
+            stream_prompts(insight_jobs, insight_placeholders, refresh=refresh_insights, label="chart_insight")
 
     elif mode == "Manual Chart Builder":
-        st.subheader("🎛️ Build Your Own Chart")
-
-        with st.form("manual_chart_form"):
-            columns = df.columns.tolist()
-            x_axis = st.selectbox("📈 X-axis", columns)
-            y_axis = st.selectbox("📉 Y-axis", columns)
-            chart_type = st.selectbox("📊 Chart Type", ["Line", "Scatter", "Bar"])
-            submit = st.form_submit_button("Generate Chart")
-        if submit:
-            try:
-                if chart_type == "Line":
-                    fig = px.line(df, x=x_axis, y=y_axis, title=f"{y_axis} over {x_axis}")
-                elif chart_type == "Scatter":
-                    fig = px.scatter(df, x=x_axis, y=y_axis, title=f"{y_axis} vs {x_axis}")
-                elif chart_type == "Bar":
-                    fig = px.bar(df, x=x_axis, y=y_axis, title=f"{y_axis} by {x_axis}")
-                else:
-                    st.warning("Unsupported chart type.")
-                    return
-                st.plotly_chart(fig, use_container_width=True)
-            except Exception as e:
-                st.error(f"⚠️ Error generating manual chart: {e}")
-                if st.button("🔁 Retry Generating Chart", key=f"retry_button_{hash(code)}"):
-                    st.rerun()
+        _manual_chart_builder(df)
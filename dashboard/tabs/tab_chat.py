@@ -3,60 +3,133 @@
 # ----------------------------
 import streamlit as st
 import re
-from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import HumanMessage
 from utils.chart_executor import get_fig_from_code
+from utils.conversation import ChatMemory
+from utils.dataset_cache import cached_derived
+from utils.prompt_context import build_digest, log_prompt_size
+from utils.query_engine import is_available, dataset_parquet_dir, describe_table, run_query, QueryError, TABLE_NAME
+from utils.tracing import plotly_chart, span
 
+# Query → result → answer round trips allowed per question
+MAX_QUERY_ROUNDS = 2
+SQL_BLOCK = re.compile(r"```sql\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+CODE_BLOCK = re.compile(r"```(?![Ss][Qq][Ll])(?:[Pp]ython)?(.*?)```", re.DOTALL)
 
-def render(df):
+
+def _query_instructions(schema):
+    return f"""
+For questions that need the whole dataset (aggregates, counts, per-period means, time above a threshold),
+do not guess from the digest. Write one DuckDB SQL query over the table `{TABLE_NAME}` in a ```sql ... ``` block
+and stop; the app runs it and replies with the result table. Quote column names with double quotes.
+Table `{TABLE_NAME}` columns:
+{schema}
+Once you have a query result, answer from it. Chart code written after a query result receives that result as `df`.
+"""
+
+
+def _preamble(df, digest, query_help):
+    # Built once per dataset version and reused verbatim, so every request shares the same cacheable prefix
+    return f"""You are a helpful data assistant for a scientist analyzing water quality data using a pandas DataFrame named `df`.
+The DataFrame has {df.shape[0]} rows and {df.shape[1]} columns. The columns are: {', '.join(map(str, df.columns))}.
+Here is a digest of the full dataset:\n\n{digest}
+
+You should:
+1. Think aloud before showing code.
+2. Generate **Python code with Plotly Express** using the DataFrame `df`.
+3. Always wrap code inside triple backticks ```python ... ``` so the app can extract it.
+
+If a question is ambiguous, ask follow-up questions before proceeding.
+{query_help}"""
+
+
+def _chat_memory():
+    # One conversation per dataset; switching files starts a fresh one
+    dataset = (st.session_state.get("dataset_key") or (None,))[0]
+    memory = st.session_state.get("chat_memory")
+    if memory is None or memory.dataset != dataset:
+        memory = st.session_state["chat_memory"] = ChatMemory(dataset)
+    return memory
+
+
+def _invoke(memory, preamble):
+    messages = memory.messages(preamble)
+    tokens = log_prompt_size("chat", messages)
+    with span("llm.invoke", label="chat", tokens=tokens):
+        response = st.session_state["model"].invoke(messages)
+    memory.add(response)
+    return response
+
+
+def render(df, meta=None, upload_collection=None, chunk_collection=None):
     st.subheader("💬 Ask the Assistant")
 
     # Chat Input
     user_prompt = st.chat_input("Ask a question or request a chart...")
     if user_prompt:
-        if "messages" not in st.session_state:
-            st.session_state["messages"] = []
-
-        # Append user message
-        st.session_state["messages"].append(HumanMessage(content=user_prompt))
+        memory = _chat_memory()
+        memory.start_turn(user_prompt)
 
         # Display user message
         with st.chat_message("user"):
             st.markdown(user_prompt)
 
-        # Construct prompt with detailed system message
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", f"""You are a helpful data assistant for a scientist analyzing water quality data using a pandas DataFrame named `df`. 
-The DataFrame has {df.shape[0]} rows and {df.shape[1]} columns. The columns are: {', '.join(df.columns)}.
-Here is a sample of the data:\n\n{df.head(50).to_string(index=False)}
-
-You should:
-1. Think aloud before showing code.
-2. Generate **Python code with Plotly Express** using the DataFrame `df`.
-3. Always wrap code inside triple backticks ```python ... ``` so the app can extract it.
+        # Aggregations run in DuckDB over an on-disk copy instead of in the prompt or in `df`
+        query_path = None
+        query_help = ""
+        if is_available() and meta is not None and st.session_state.get("dataset_key"):
+            try:
+                query_path = dataset_parquet_dir(meta, upload_collection, chunk_collection, st.session_state["dataset_key"])
+                query_help = _query_instructions(cached_derived("query_schema", lambda: describe_table(query_path)))
+            except Exception as e:
+                query_path = None
+                st.caption(f"⚠️ Query engine unavailable: {e}")
 
-If a question is ambiguous, ask follow-up questions before proceeding.
-"""),
-            MessagesPlaceholder(variable_name="messages")
-        ])
+        preamble = cached_derived(
+            f"chat_preamble:{bool(query_help)}",
+            lambda: _preamble(df, cached_derived("prompt_digest_chat", lambda: build_digest(df)), query_help),
+        )
 
         # Get response from model
-        response = (prompt | st.session_state["model"]).invoke({"messages": st.session_state["messages"]})
+        response = _invoke(memory, preamble)
 
         # Display assistant reply
         with st.chat_message("assistant"):
-            st.session_state["messages"].append(response)
+            # Run requested queries and hand the results back until the model answers
+            chart_df, chart_key = df, None
+            for _ in range(MAX_QUERY_ROUNDS):
+                sql_match = SQL_BLOCK.search(response.content) if query_path else None
+                if not sql_match:
+                    break
+                sql = sql_match.group(1).strip()
+                st.code(sql, language="sql")
+                try:
+                    result, truncated = run_query(sql, query_path)
+                    st.dataframe(result, width="stretch")
+                    chart_df, chart_key = result, ("query-result", st.session_state["dataset_key"][1], sql)
+                    feedback = (
+                        f"Query result ({len(result)} rows{', truncated' if truncated else ''}):\n"
+                        f"{result.to_csv(index=False, float_format='%.6g')}"
+                    )
+                except QueryError as e:
+                    st.warning(f"⚠️ Query failed: {e}")
+                    feedback = f"The query failed: {e}\nFix the SQL or answer without it."
+                memory.add(HumanMessage(content=feedback))
+                response = _invoke(memory, preamble)
 
             # Extract chart code
-            code_block_match = re.search(r'```(?:[Pp]ython)?(.*?)```', response.content, re.DOTALL)
+            code_block_match = CODE_BLOCK.search(response.content)
             chart_code = code_block_match.group(1).strip() if code_block_match else ""
 
             if chart_code:
-                fig = get_fig_from_code(chart_code, df)
+                fig = get_fig_from_code(chart_code, chart_df, dataset_key=chart_key)
                 if fig:
-                    st.plotly_chart(fig, use_container_width=True)
+                    plotly_chart(fig, width="stretch")
                     st.markdown("✅ Chart generated successfully.")
                 else:
                     st.markdown("⚠️ Chart code found, but something went wrong. Try checking if `fig = px...` is correctly defined.")
             else:
                 st.markdown(response.content)
+
+        # History is trimmed and older turns summarized after the answer is on screen
+        memory.end_turn(st.session_state["model"], st.session_state.get("llm_cache"))
@@ -5,76 +5,179 @@ import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
 from langchain_core.messages import HumanMessage
-from utils.mongo_utils import fetch_wamo_df, normalize_columns, generate_comparison_prompt
-
-def render(df, selected_lake, WAMO_MAPPING, wamo_collection):
-    st.subheader("📋 LLM-Based Comparison with WAMO")
-
-    wamo_df = fetch_wamo_df(selected_lake, WAMO_MAPPING, wamo_collection)
-    if not wamo_df.empty:
-        # Normalize column names
-        df = normalize_columns(df)
-        wamo_df = normalize_columns(wamo_df)
-
-        # LLM Summary Prompt
-        compare_prompt = generate_comparison_prompt(df, wamo_df)
-        response = st.session_state["model"].invoke([HumanMessage(content=compare_prompt)])
-        st.markdown(response.content)
-
-        # Detect date columns
-        def find_date_column(df):
-            for col in df.columns:
-                if "date" in col.lower() or "time" in col.lower():
-                    return col
-            return None
-
-        date_col_manual = find_date_column(df)
-        date_col_wamo = find_date_column(wamo_df)
-
-        if date_col_manual and date_col_wamo:
-            try:
-                df['date'] = pd.to_datetime(df[date_col_manual])
-                wamo_df['date'] = pd.to_datetime(wamo_df[date_col_wamo])
-
-                st.subheader("📈 Matched Time Series Parameters")
-                common_cols = list(set(df.columns) & set(wamo_df.columns))
-                numeric_cols = [col for col in common_cols if pd.api.types.is_numeric_dtype(df[col]) and pd.api.types.is_numeric_dtype(wamo_df[col])]
-
-                for col in numeric_cols:
-                    st.markdown(f"#### 📊 {col} (Manual vs. WAMO)")
-                    merged = pd.merge(
-                        df[['date', col]],
-                        wamo_df[['date', col]],
-                        on='date',
-                        how='inner',
-                        suffixes=('_manual', '_wamo')
-                    )
-
-                    fig = go.Figure()
-                    fig.add_trace(go.Scatter(
-                        x=merged['date'],
-                        y=merged[f"{col}_manual"],
-                        mode='lines+markers',
-                        name=f'Manual {col}'
-                    ))
-                    fig.add_trace(go.Scatter(
-                        x=merged['date'],
-                        y=merged[f"{col}_wamo"],
-                        mode='lines+markers',
-                        name=f'WAMO {col}'
-                    ))
-
-                    fig.update_layout(
-                        title=f"{col} Over Time",
-                        xaxis_title='Date',
-                        yaxis_title=col,
-                        template="plotly_white"
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-
-            except Exception as e:
-                st.warning(f"📅 Error processing date columns: {e}")
-        else:
-            st.warning("📅 Could not detect valid date/time columns in one of the datasets.")
+from utils.mongo_utils import fetch_wamo_frames, normalize_columns, generate_comparison_prompt
+from utils.llm_orchestrator import prompt_job
+from utils.comparison import align_datasets, comparison_stats, station_summary
+from utils.jobs import frame_from_doc, frame_to_doc, wait_for_job
+from utils.downsample import downsample_frame, make_scatter
+from utils.tracing import plotly_chart
+
+# Matching tolerance choices; the sensor fetch window is padded by the same amount
+TOLERANCE_OPTIONS = ["5min", "15min", "30min", "1h", "3h", "1D"]
+
+# Detect date columns
+def find_date_column(df):
+    for col in df.columns:
+        if "date" in col.lower() or "time" in col.lower():
+            return col
+    return None
+
+def match_station(df, date_col_manual, wamo_df, tolerance, method):
+    """Matched-series stats and a downsampled series per parameter for one station; None without a sensor date column."""
+    date_col_wamo = find_date_column(wamo_df)
+    if not date_col_wamo:
+        return None
+    numeric_cols = [
+        col for col in df.columns
+        if col in wamo_df.columns and col not in (date_col_manual, date_col_wamo)
+        and pd.api.types.is_numeric_dtype(df[col]) and pd.api.types.is_numeric_dtype(wamo_df[col])
+    ]
+    try:
+        # Align once for all parameters instead of one exact-date merge per column
+        aligned = align_datasets(
+            df, wamo_df, date_col_manual, date_col_wamo, numeric_cols, tolerance=tolerance, method=method
+        )
+    except Exception as e:
+        return {"error": str(e)}
+    series = []
+    for col in numeric_cols:
+        pair = [f"{col}_manual", f"{col}_wamo"]
+        series.append({"column": col, "frame": frame_to_doc(downsample_frame(aligned, 'date', pair)[['date', *pair]])})
+    return {"stats": frame_to_doc(comparison_stats(aligned, numeric_cols)), "series": series}
+
+def summary_job(ctx, df, mapping, collection, stations, start, end, columns, tolerance, method):
+    """Job handler: fetch every station's sensor window concurrently, summarize and match it against `df`."""
+    ctx.progress(0.05, f"fetching {len(stations)} WAMO station(s)")
+    frames = fetch_wamo_frames(stations, mapping, collection, start=start, end=end, columns=columns)
+    frames = {lake: normalize_columns(frame) for lake, frame in frames.items() if not frame.empty}
+    ctx.progress(0.7, "summarizing")
+    df = normalize_columns(df.copy(deep=False))
+    date_col = find_date_column(df)
+    summary = pd.DataFrame()
+    matched = []
+    if date_col and frames:
+        summary = station_summary(
+            df, date_col, {lake: (frame, find_date_column(frame)) for lake, frame in frames.items()},
+            [col for col in columns if col != date_col]
+        )
+        ctx.progress(0.85, "matching time series")
+        # Every station is matched here, so switching the detail station is a lookup
+        matched = [
+            {"station": lake, "match": match_station(df, date_col, frame, tolerance, method)}
+            for lake, frame in frames.items()
+        ]
+    return {"summary": frame_to_doc(summary), "stations": list(frames), "matched": matched}
+
+def render(df, selected_lake, WAMO_MAPPING, wamo_collection, jobs):
+    st.subheader("📋 Comparison with WAMO")
+
+    # Normalize column names (on a shallow copy; the loaded frame is shared via the dataset cache)
+    df = normalize_columns(df.copy(deep=False))
+
+    col_method, col_tolerance = st.columns(2)
+    align_method = col_method.radio(
+        "Alignment", ["asof", "resample"], horizontal=True,
+        format_func=lambda m: "Nearest reading" if m == "asof" else "Common interval"
+    )
+    tolerance = col_tolerance.select_slider("Matching tolerance / interval", TOLERANCE_OPTIONS, value="30min")
+    window_pad = pd.Timedelta(tolerance)
+
+    # Only fetch the sensor window and parameters the manual data can be compared against
+    start = end = None
+    date_col_manual = find_date_column(df)
+    if date_col_manual:
+        manual_dates = pd.to_datetime(df[date_col_manual], errors="coerce")
+        if manual_dates.notna().any():
+            start, end = manual_dates.min() - window_pad, manual_dates.max() + window_pad
+    manual_numeric = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col])]
+
+    stations = st.multiselect(
+        "🏞️ WAMO stations", list(WAMO_MAPPING.keys()),
+        default=[selected_lake] if selected_lake in WAMO_MAPPING else None
+    )
+    if not stations:
+        st.info("Select at least one WAMO station.")
+        return
+
+    # Fetching and summarizing run as a background job shared by everyone comparing the same data
+    params = {
+        "stations": stations,
+        "start": start.isoformat() if start is not None else None,
+        "end": end.isoformat() if end is not None else None,
+        "columns": manual_numeric,
+        "tolerance": tolerance,
+        "method": align_method,
+    }
+    job = wait_for_job(jobs, jobs.submit("comparison", st.session_state.get("dataset_key"), params), "📡 Comparing with WAMO")
+    if job is None:
+        return
+    if job["status"] != "done":
+        # Shown until retried, rather than refetching on every rerun
+        st.warning(f"⚠️ Comparison did not finish: {job.get('error') or job['status']}")
+        if st.button("🔄 Retry comparison", key="retry_comparison"):
+            jobs.submit("comparison", st.session_state.get("dataset_key"), params, refresh=True)
+            st.rerun()
+        return
+    fetched = job["result"]["stations"]
+    missing = [lake for lake in stations if lake not in fetched]
+    if missing:
+        st.warning(f"⚠️ No WAMO data found for: {', '.join(missing)}.")
+    if not fetched:
+        return
+
+    if date_col_manual:
+        summary = frame_from_doc(job["result"]["summary"])
+        st.markdown("#### 📊 Station Summary")
+        st.dataframe(summary, width="stretch", hide_index=True)
+
+        # Optional narration of the numbers above
+        col_narrate, col_refresh = st.columns([3, 1])
+        if col_narrate.toggle("📝 Assistant commentary", key="narrate_comparison") and not summary.empty:
+            refresh_comparison = col_refresh.button("🔄 Regenerate", key="refresh_comparison")
+            commentary = prompt_job(
+                jobs, st.session_state.get("dataset_key"),
+                [HumanMessage(content=generate_comparison_prompt(summary))], "comparison", refresh=refresh_comparison
+            )
+            if commentary is not None:
+                st.markdown(commentary)
+
+    # Matched time series for one station at a time
+    detail_lake = fetched[0]
+    if len(fetched) > 1:
+        default = fetched.index(selected_lake) if selected_lake in fetched else 0
+        detail_lake = st.selectbox("Station for matched time series", fetched, index=default)
+    match = next((m["match"] for m in job["result"]["matched"] if m["station"] == detail_lake), None)
+
+    if match is None:
+        st.warning("📅 Could not detect valid date/time columns in one of the datasets.")
+    elif "error" in match:
+        st.warning(f"📅 Error processing date columns: {match['error']}")
     else:
-        st.warning("⚠️ No WAMO data found for the selected lake.")
+        st.subheader("📈 Matched Time Series Parameters")
+        st.dataframe(frame_from_doc(match["stats"]), width="stretch")
+
+        for entry in match["series"]:
+            col, shown = entry["column"], frame_from_doc(entry["frame"])
+            st.markdown(f"#### 📊 {col} (Manual vs. WAMO)")
+
+            fig = go.Figure()
+            fig.add_trace(make_scatter(
+                shown['date'],
+                shown[f"{col}_manual"],
+                mode='lines+markers',
+                name=f'Manual {col}'
+            ))
+            fig.add_trace(make_scatter(
+                shown['date'],
+                shown[f"{col}_wamo"],
+                mode='lines+markers',
+                name=f'WAMO {col}'
+            ))
+
+            fig.update_layout(
+                title=f"{col} Over Time",
+                xaxis_title='Date',
+                yaxis_title=col,
+                template="plotly_white"
+            )
+            plotly_chart(fig, width="stretch")
@@ -1,29 +1,43 @@
 
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from langchain_core.messages import HumanMessage
-import plotly.figure_factory as ff
 import numpy as np
-def render(df):
-    st.subheader("🔍 Preview Uploaded Data")
+from utils.llm_orchestrator import prompt_job
+from utils.downsample import downsample_indices, make_scatter
+from utils.profile import compute_profile, missing_table, numeric_summary_table, profile_prompt_sections
+from utils.missing_index import build_missing_index, query_missing_index
+from utils.distribution import distribution_figure
+from utils.dataset_cache import cached_derived
+from utils.compact import memory_report, memory_totals
+from utils.prompt_context import build_digest, PROMPT_TOKEN_BUDGET
+from utils.outliers import outlier_fences, outlier_view, outlier_counts, outlier_params, load_fences, OUTLIER_WINDOW, OUTLIER_THRESHOLD
+from utils.jobs import wait_for_job
+from utils.tracing import plotly_chart
 
-    # 🧠 AI LLM Summary
-    with st.expander("🧠 AI Summary of Your Dataset", expanded=True):
-        try:
-            df_preview = df.head(5).to_string(index=False)
-            missing_summary = df.isnull().mean().round(3) * 100
-            missing_str = missing_summary.to_string()
-            numeric_df = df.select_dtypes(include='number')
-            stats = numeric_df.describe().T[['mean', 'std', 'min', 'max']].to_string()
-
-            summary_prompt =  f"""
+MISSING_PAGE_SIZE = 100
+
+
+# Fragments: widget interaction inside one re-executes only that section
+@st.fragment
+def _summary_section(df, profile, jobs):
+    refresh_summary = st.button("🔄 Regenerate Summary", key="refresh_summary")
+    try:
+        # Statistics are already below, so the digest only adds time coverage, period means and samples
+        df_preview = cached_derived("summary_digest", lambda: build_digest(
+            df, profile, token_budget=PROMPT_TOKEN_BUDGET // 2, sections=("time", "aggregates", "sample")
+        ))
+        sections = profile_prompt_sections(profile)
+        missing_str = sections["missing"]
+        stats = sections["stats"]
+
+        summary_prompt =  f"""
 You are a senior environmental scientist advising on water quality in the EU region. You are analyzing data collected from a freshwater monitoring station, loaded as a pandas DataFrame named `df`.
 
 The dataset contains {df.shape[0]} rows and {df.shape[1]} columns.
 
-🧪 Sample (first 5 rows):
+🧪 Time coverage, period means and evenly spaced sample rows:
 {df_preview}
 
 📉 Missing values (% per column):
@@ -32,6 +46,10 @@ The dataset contains {df.shape[0]} rows and {df.shape[1]} columns.
 📊 Numeric statistics (mean, std, min, max):
 {stats}
 
+📏 Low-variance columns: {sections["low_variance"]}
+
+🕒 Timestamps: {sections["timing"]}
+
 Write a detailed, expert-level summary structured as follows:
 
 ---
@@ -60,10 +78,164 @@ Summarize the dataset’s overall health and fitness for analysis:
 
 Avoid generic statements like “There are X rows and Y columns.” Your goal is to help scientists and EU-level regulators make informed decisions based on this data.
 """
-            response = st.session_state["model"].invoke([HumanMessage(content=summary_prompt)])
-            st.markdown(response.content)
-        except Exception as e:
-            st.warning(f"⚠️ Could not generate LLM summary: {e}")
+        # Runs as a background job shared by everyone viewing this dataset version
+        summary = prompt_job(
+            jobs, st.session_state.get("dataset_key"), [HumanMessage(content=summary_prompt)], "summary", refresh=refresh_summary
+        )
+        if summary is not None:
+            st.markdown(summary)
+    except Exception as e:
+        st.warning(f"⚠️ Could not generate LLM summary: {e}")
+
+
+# Paged run-length gap listing
+@st.fragment
+def _missing_locations(df, profile):
+    time_col = profile["time"]["column"] if profile.get("time") else None
+    missing_index = cached_derived("missing_index", lambda: build_missing_index(df, time_col))
+
+    if not missing_index.empty:
+        filter_col, page_col = st.columns([3, 1])
+        col_filter = filter_col.selectbox(
+            "🔽 Filter missing values by column:",
+            ["All"] + sorted(missing_index["Column"].unique().tolist()),
+            key="missing_filter"
+        )
+        page = page_col.number_input("Page", min_value=1, value=1, key="missing_page")
+        page_rows, total = query_missing_index(
+            missing_index,
+            None if col_filter == "All" else col_filter,
+            page=page - 1,
+            page_size=MISSING_PAGE_SIZE
+        )
+        st.caption(f"{total:,} gaps, largest first · showing {len(page_rows)} of {total:,}")
+        st.dataframe(page_rows)
+    else:
+        st.success("✅ No missing values found in the dataset.")
+
+
+# Distribution for the selected column
+@st.fragment
+def _distribution_section(df, numeric_cols):
+    st.markdown("### 📈 Distribution (Bell Curve)")
+    selected_col = st.selectbox("Select a numeric column to view distribution:", numeric_cols)
+    selected_data = df[selected_col].dropna().to_numpy(dtype="float64")
+    if len(selected_data) > 1:
+        custom_colors = ['#8ab6f9']  # soft blue
+
+        # Freedman–Diaconis histogram + binned KDE + sampled rug
+        fig = distribution_figure(selected_data, selected_col, custom_colors[0])
+        fig.update_layout(
+            title=f"Distribution of {selected_col}",
+            yaxis_title="Density",
+            template="plotly_white",
+           
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=1.02,
+                xanchor="center",
+                x=0.5,
+                )
+         )
+        fig.update_xaxes(title_text=selected_col, row=2, col=1)
+        plotly_chart(fig, width="stretch")
+    else:
+        st.warning("⚠️ Not enough data to plot a distribution.")
+
+
+def _stored_fences(df, date_col, numeric_cols, jobs, outlier_collection):
+    # Fences for every column, computed once per dataset version by a background job and stored
+    name = f"outlier_fences:{date_col}:{OUTLIER_WINDOW}:{OUTLIER_THRESHOLD}"
+    dataset_key = st.session_state.get("dataset_key")
+    if dataset_key is None or jobs is None or outlier_collection is None:
+        return cached_derived(name, lambda: outlier_fences(df, date_col, numeric_cols))
+    params = outlier_params(date_col, numeric_cols)
+    fences = cached_derived(name, lambda: load_fences(dataset_key, params, outlier_collection))
+    if fences is not None:
+        return fences
+    job = wait_for_job(jobs, jobs.submit("outliers", dataset_key, params), "🚨 Flagging outliers")
+    if job is None:
+        return None
+    if job["status"] == "done":
+        return cached_derived(name, lambda: load_fences(dataset_key, params, outlier_collection))
+    st.warning(f"⚠️ Background outlier flagging did not finish ({job.get('error') or job['status']}); computing here.")
+    return cached_derived(name, lambda: outlier_fences(df, date_col, numeric_cols))
+
+
+# Outlier chart for the selected parameter; inspecting another parameter is a lookup in the stored fences
+@st.fragment
+def _outlier_section(df, numeric_cols, profile, jobs=None, outlier_collection=None):
+    date_cols = [col for col in df.columns if "date" in col.lower() or "time" in col.lower()]
+    if date_cols:
+        time_col = profile["time"]["column"] if profile.get("time") else None
+        date_col = st.selectbox(
+            "Select a date/time column", date_cols, index=date_cols.index(time_col) if time_col in date_cols else 0
+        )
+        fences = _stored_fences(df, date_col, numeric_cols, jobs, outlier_collection)
+        if fences is None:
+            return
+        st.caption(f"Rolling {OUTLIER_WINDOW} median ± {OUTLIER_THRESHOLD:g}×MAD fences, all numeric columns:")
+        st.dataframe(outlier_counts(fences, numeric_cols), hide_index=True)
+
+        param_col = st.selectbox("Select a numeric column to visualize", numeric_cols)
+        view = outlier_view(fences, df, date_col, param_col)
+
+        # Reduce to a fixed point budget; outliers are always kept
+        shown = view.iloc[downsample_indices(view[date_col], view[param_col], keep_mask=view["is_outlier"])]
+        outliers = view[view["is_outlier"]]
+
+        fig = go.Figure()
+        fig.add_trace(make_scatter(
+            shown[date_col],
+            shown["upper"],
+            mode='lines',
+            name="Upper Fence",
+            line=dict(color="rgba(138, 182, 249, 0.6)", width=1)
+        ))
+        fig.add_trace(make_scatter(
+            shown[date_col],
+            shown["lower"],
+            mode='lines',
+            name="Lower Fence",
+            line=dict(color="rgba(138, 182, 249, 0.6)", width=1),
+            fill='tonexty',
+            fillcolor="rgba(138, 182, 249, 0.15)"
+        ))
+        fig.add_trace(make_scatter(
+            shown[date_col],
+            shown[param_col],
+            mode='lines+markers',
+            name="Normal Values",
+            marker=dict(color="gray"),
+            line=dict(color="lightgray")
+        ))
+        fig.add_trace(make_scatter(
+            outliers[date_col],
+            outliers[param_col],
+            mode='markers',
+            name="Possible Outliers",
+            marker=dict(color="red", size=10, symbol="circle-open")
+        ))
+        fig.update_layout(
+            title=f"{param_col} Over Time (Outliers Highlighted)",
+            xaxis_title=date_col,
+            yaxis_title=param_col,
+            template="plotly_white"
+        )
+        plotly_chart(fig, width="stretch")
+    else:
+        st.warning("⚠️ No date/time column found. Add one to enable this chart.")
+
+
+def render(df, profile=None, jobs=None, outlier_collection=None):
+    profile = profile or compute_profile(df)
+
+    st.subheader("🔍 Preview Uploaded Data")
+
+    # 🧠 AI LLM Summary
+    with st.expander("🧠 AI Summary of Your Dataset", expanded=True):
+        _summary_section(df, profile, jobs)
 
     # 📋 First 100 rows
     with st.expander("🔍 View First 100 Rows"):
@@ -74,31 +246,11 @@ Avoid generic statements like “There are X rows and Y columns.” Your goal is
     with st.expander("❓ Missing Value Summary", expanded=False):
         # 🔹 Column-level summary
         st.markdown("**🔹 Missing Count per Column:**")
-        st.dataframe(
-            df.isnull().sum()
-            .reset_index()
-            .rename(columns={"index": "Column", 0: "Missing Count"})
-        )
+        st.dataframe(missing_table(profile))
 
         # 🔍 Row-level missing value detail
         st.markdown("**🔍 Detailed Missing Value Locations:**")
-        missing_locations = df.isnull().stack().reset_index()
-        missing_locations.columns = ["Row Index", "Column", "Is Missing"]
-        missing_locations = missing_locations[missing_locations["Is Missing"] == True].drop("Is Missing", axis=1)
-
-        if not missing_locations.empty:
-            col_filter = st.selectbox(
-                "🔽 Filter missing values by column:",
-                ["All"] + sorted(missing_locations["Column"].unique().tolist()),
-                key="missing_filter"
-            )
-            if col_filter != "All":
-                filtered = missing_locations[missing_locations["Column"] == col_filter]
-                st.dataframe(filtered)
-            else:
-                st.dataframe(missing_locations)
-        else:
-            st.success("✅ No missing values found in the dataset.")
+        _missing_locations(df, profile)
 
     # 🔠 Column types
     # with st.expander("🔠 Column Data Types"):
@@ -108,103 +260,27 @@ Avoid generic statements like “There are X rows and Y columns.” Your goal is
     #         .rename(columns={"index": "Column", 0: "Data Type"})
     #     )
 
+    # 💾 Memory usage per column
+    with st.expander("💾 Memory Usage", expanded=False):
+        report = cached_derived("memory_report", lambda: memory_report(df))
+        used, default, saved = memory_totals(report)
+        st.caption(f"{used:,.1f} MB in this session; {default:,.1f} MB with default dtypes ({saved:.0%} saved).")
+        st.dataframe(report, width="stretch", hide_index=True)
+
     # 📊 Numeric summary statistics
-    numeric_df = df.select_dtypes(include='number')
-    if not numeric_df.empty:
+    summary = numeric_summary_table(profile)
+    numeric_cols = summary["Column"].tolist()
+    if numeric_cols:
         with st.expander("📊 Numeric Summary Statistics", expanded=False):
-            stats = numeric_df.describe().T
-            missing_percent = df[numeric_df.columns].isnull().mean() * 100
-
-            summary = stats[['mean', 'std', 'min', 'max']].copy()
-            summary['% Missing'] = missing_percent
-            summary = summary.reset_index().rename(columns={'index': 'Column'})
             st.dataframe(summary)
 
             # 🔔 Bell Curve Visualization
-            st.markdown("### 📈 Distribution (Bell Curve)")
-            selected_col = st.selectbox("Select a numeric column to view distribution:", numeric_df.columns)
-            selected_data = df[selected_col].dropna().values.tolist()
-            if len(selected_data) > 1:
-                hist_data = [selected_data]
-                group_labels = [selected_col]
-                custom_colors = ['#8ab6f9']  # soft blue
-
-                fig = ff.create_distplot(
-                    hist_data,
-                    group_labels,
-                    show_hist=True,   # Histogram
-                    show_rug=True,    # Rug plot (small vertical lines)
-                    show_curve=True,
-                    bin_size=0.2,
-                    curve_type='kde',
-                    colors=custom_colors,
-  # KDE line (bell curve)
-                )
-                fig.update_layout(
-                    title=f"Distribution of {selected_col}",
-                    xaxis_title=selected_col,
-                    yaxis_title="Density",
-                    template="plotly_white",
-                   
-                    legend=dict(
-                        orientation="h",
-                        yanchor="bottom",
-                        y=1.02,
-                        xanchor="center",
-                        x=0.5,
-                        )
-                 )
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.warning("⚠️ Not enough data to plot a distribution.")
+            _distribution_section(df, numeric_cols)
     else:
         st.info("No numeric columns found for summary statistics.")
 
 
     # 🚨 Outlier detection
-    if not numeric_df.empty:
+    if numeric_cols:
         with st.expander("🚨 Outlier Detection Over Time"):
-            date_cols = [col for col in df.columns if "date" in col.lower() or "time" in col.lower()]
-            if date_cols:
-                date_col = st.selectbox("Select a date/time column", date_cols)
-                param_col = st.selectbox("Select a numeric column to visualize", numeric_df.columns)
-
-                df_copy = df[[date_col, param_col]].dropna()
-                df_copy[date_col] = pd.to_datetime(df_copy[date_col], errors='coerce')
-                df_copy = df_copy.dropna()
-
-                Q1 = df_copy[param_col].quantile(0.25)
-                Q3 = df_copy[param_col].quantile(0.75)
-                IQR = Q3 - Q1
-                lower_bound = Q1 - 1.5 * IQR
-                upper_bound = Q3 + 1.5 * IQR
-
-                df_copy["is_outlier"] = (
-                    (df_copy[param_col] < lower_bound) | (df_copy[param_col] > upper_bound)
-                )
-
-                fig = go.Figure()
-                fig.add_trace(go.Scatter(
-                    x=df_copy[date_col],
-                    y=df_copy[param_col],
-                    mode='lines+markers',
-                    name="Normal Values",
-                    marker=dict(color="gray"),
-                    line=dict(color="lightgray")
-                ))
-                fig.add_trace(go.Scatter(
-                    x=df_copy[df_copy["is_outlier"]][date_col],
-                    y=df_copy[df_copy["is_outlier"]][param_col],
-                    mode='markers',
-                    name="Possible Outliers",
-                    marker=dict(color="red", size=10, symbol="circle-open")
-                ))
-                fig.update_layout(
-                    title=f"{param_col} Over Time (Outliers Highlighted)",
-                    xaxis_title=date_col,
-                    yaxis_title=param_col,
-                    template="plotly_white"
-                )
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.warning("⚠️ No date/time column found. Add one to enable this chart.")
+            _outlier_section(df, numeric_cols, profile, jobs, outlier_collection)
@@ -0,0 +1,53 @@
+# ----------------------------
+# File: utils/catalog.py
+# ----------------------------
+# Lightweight catalog of stored uploads: one small document per file with its
+# size, shape and hash, so listing files never touches the upload or chunk
+# collections. Indexed on filename and upload time for the sidebar listing.
+import datetime
+
+import streamlit as st
+
+CATALOG_TTL_S = 10
+
+
+def ensure_catalog_indexes(catalog_collection):
+    catalog_collection.create_index("filename", unique=True)
+    catalog_collection.create_index([("uploaded_at", -1)])
+
+
+def record_upload(catalog_collection, meta, size_bytes=None):
+    """Upsert the catalog entry for a stored upload's metadata document (size kept when not given)."""
+    entry = {
+        "filename": meta["filename"],
+        "upload_id": meta["_id"],
+        "uploaded_at": meta.get("updated_at") or meta.get("uploaded_at") or datetime.datetime.utcnow(),
+        "row_count": meta.get("row_count"),
+        "columns": meta.get("columns", []),
+        "content_hash": meta.get("content_hash"),
+    }
+    if size_bytes is not None:
+        entry["size_bytes"] = size_bytes
+    catalog_collection.update_one({"filename": meta["filename"]}, {"$set": entry}, upsert=True)
+
+
+def remove_upload(catalog_collection, filename):
+    catalog_collection.delete_one({"filename": filename})
+
+
+def backfill_catalog(catalog_collection, upload_collection):
+    # Uploads stored before the catalog existed; a no-op once the catalog is populated
+    if catalog_collection.estimated_document_count() or not upload_collection.estimated_document_count():
+        return 0
+    count = 0
+    for meta in upload_collection.find({"status": {"$ne": "writing"}}, {"data": 0}).sort("uploaded_at", 1):
+        record_upload(catalog_collection, meta)
+        count += 1
+    return count
+
+
+@st.cache_data(ttl=CATALOG_TTL_S, show_spinner=False)
+def list_uploaded_filenames(_catalog_collection):
+    """Filenames, newest first; served from cache for CATALOG_TTL_S seconds between uploads."""
+    cursor = _catalog_collection.find({}, {"filename": 1, "_id": 0}).sort("uploaded_at", -1)
+    return [doc["filename"] for doc in cursor]
@@ -1,14 +1,168 @@
+import glob
+import hashlib
+import os
+import queue
+import re
+import subprocess
+import sys
+import tempfile
+import multiprocessing as mp
+
 import streamlit as st
 import plotly.express as px
+import pyarrow as pa
+
+from utils.figure_cache import cached_figure, normalize_code
+from utils.storage import to_arrow_table
+from utils.tracing import traced
+
+# "process" runs chart code in a pool of worker processes; "inline" keeps the old in-server exec
+CHART_EXECUTOR = os.getenv("CHART_EXECUTOR", "process")
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", 2))
+CHART_TIMEOUT_S = float(os.getenv("CHART_TIMEOUT_S", 20))
+CHART_WORKER_MEMORY_MB = int(os.getenv("CHART_WORKER_MEMORY_MB", 4096))
+SHARED_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+# Total size of the Arrow copies kept in SHARED_DIR (RAM on Linux), across datasets and server processes
+CHART_SHARED_MB = int(os.getenv("CHART_SHARED_MB", 1024))
+# Left out of a worker's environment: MONGO_URI, GROQ_API_KEY and other Streamlit secrets exported there
+SENSITIVE_ENV = re.compile(r"KEY|SECRET|TOKEN|PASS|CREDENTIAL|URI|MONGO|GROQ", re.IGNORECASE)
+DASHBOARD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ChartTimeoutError(Exception):
+    pass
+
+
+class ChartWorkerPool:
+    def __init__(self, size, timeout, memory_limit_mb):
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        # Empty, so chart code can't reach .streamlit/secrets.toml through a relative path
+        self.workdir = tempfile.mkdtemp(prefix="chart-worker-")
+        self._idle = queue.Queue()
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+    def _worker_env(self):
+        env = {name: value for name, value in os.environ.items() if not SENSITIVE_ENV.search(name)}
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [DASHBOARD_DIR, env.get("PYTHONPATH")]))
+        return env
+
+    def _spawn(self):
+        # A fresh interpreter rather than multiprocessing's spawn, which re-imports Streamlit's
+        # __main__ (app.py, with its clients, secrets and job workers) in every child
+        parent_conn, child_conn = mp.Pipe()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "utils.chart_worker", str(child_conn.fileno()), str(self.memory_limit_mb)],
+            pass_fds=(child_conn.fileno(),),
+            stdin=subprocess.DEVNULL,
+            env=self._worker_env(),
+            cwd=self.workdir,
+        )
+        child_conn.close()
+        return process, parent_conn
+
+    def _replace(self, process):
+        process.kill()
+        process.wait()
+        return self._spawn()
+
+    def run(self, code, dataset_path):
+        """Execute `code` against the dataset at `dataset_path`; returns the figure JSON."""
+        process, conn = self._idle.get()
+        try:
+            conn.send((code, dataset_path))
+            if not conn.poll(self.timeout):
+                process, conn = self._replace(process)
+                raise ChartTimeoutError(f"Chart code took longer than {self.timeout:.0f}s and was stopped.")
+            status, payload = conn.recv()
+        except (EOFError, BrokenPipeError, ConnectionResetError):
+            process, conn = self._replace(process)
+            raise RuntimeError("Chart worker crashed while running the code.")
+        finally:
+            self._idle.put((process, conn))
+        if status != "ok":
+            raise ValueError(payload)
+        return payload
+
+
+@st.cache_resource
+def get_chart_pool():
+    return ChartWorkerPool(CHART_WORKERS, CHART_TIMEOUT_S, CHART_WORKER_MEMORY_MB)
 
-def get_fig_from_code(code, df):
+
+def _digest(value):
+    return hashlib.sha1(repr(value).encode("utf-8")).hexdigest()[:16]
+
+
+def _trim_shared(keep):
+    # Least recently used copies go first; a worker that already loaded one keeps its frame
+    files = []
+    for path in glob.glob(os.path.join(SHARED_DIR, "chartdata-*.arrow")):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= CHART_SHARED_MB * 1024 * 1024:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def publish_dataset(df, dataset_key=None):
+    """Write `df` once as an Arrow IPC file in shared memory so workers can memory-map it."""
+    dataset_key = dataset_key or st.session_state.get("dataset_key") or ("adhoc", id(df), df.shape)
+    prefix = os.path.join(SHARED_DIR, f"chartdata-{_digest(dataset_key[0])}-")
+    path = f"{prefix}{_digest(dataset_key[1:])}.arrow"
+    try:
+        # Marks the copy as recently used for _trim_shared
+        os.utime(path)
+    except FileNotFoundError:
+        table = to_arrow_table(df)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+        # Older versions of the same file are no longer needed
+        for stale in glob.glob(f"{prefix}*.arrow"):
+            if stale != path:
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+        _trim_shared(path)
+    return path
+
+
+def _run_inline(code, df):
     local_vars = {"df": df.copy(), "px": px}
+    exec(code, {}, local_vars)
+    fig = local_vars.get("fig")
+    if not fig:
+        raise ValueError("⚠️ No chart generated. Ensure code assigns to `fig`.")
+    return fig
+
+
+def _build_fig(code, df, dataset_key):
+    if CHART_EXECUTOR == "inline":
+        return _run_inline(code, df)
+    return get_chart_pool().run(code, publish_dataset(df, dataset_key))
+
+
+@traced("chart.get_fig_from_code", traces=lambda fig: len(fig.data))
+def get_fig_from_code(code, df, dataset_key=None):
+    # `dataset_key` names frames other than the session's dataset (e.g. a query result)
     try:
-        exec(code, {}, local_vars)
-        fig = local_vars.get("fig")
-        if not fig:
-            raise ValueError("⚠️ No chart generated. Ensure code assigns to `fig`.")
-        return fig
+        return cached_figure("code", (dataset_key, normalize_code(code)), lambda: _build_fig(code, df, dataset_key))
     except Exception as e:
         st.error(f"⚠️ Error generating chart: {e}")
         if st.button("🔁 Retry Generating Chart", key=f"retry_button_{hash(code)}"):
@@ -0,0 +1,80 @@
+# ----------------------------
+# File: utils/chart_worker.py
+# ----------------------------
+# Entry point for chart worker processes, started by the chart executor as
+# `python -m utils.chart_worker <fd> <memory MB>` with secrets left out of
+# the environment and an empty working directory. Kept free of Streamlit
+# imports so workers start quickly. Datasets arrive as memory-mapped Arrow
+# IPC files and are loaded at most once per worker: columns without missing
+# values stay read-only views of the shared mapping, the rest are converted
+# into the worker's memory. Figures go back as JSON.
+import resource
+import sys
+from collections import OrderedDict
+from multiprocessing.connection import Connection
+
+MAX_WORKER_DATASETS = 2
+
+
+def _limit_memory(memory_limit_mb):
+    if memory_limit_mb:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _load_dataset(path, frames):
+    import pyarrow as pa
+
+    if path in frames:
+        frames.move_to_end(path)
+        return frames[path]
+    with pa.memory_map(path, "r") as source:
+        # Separate blocks per column, so columns that need no conversion aren't consolidated into a copy
+        df = pa.ipc.open_file(source).read_all().to_pandas(split_blocks=True)
+    frames[path] = df
+    while len(frames) > MAX_WORKER_DATASETS:
+        frames.popitem(last=False)
+    return df
+
+
+def worker_main(conn, memory_limit_mb):
+    _limit_memory(memory_limit_mb)
+
+    import pandas as pd
+    import plotly.express as px
+
+    # Shallow copies below are only safe from in-place writes with copy-on-write,
+    # which pandas 3 always uses (and warns about the option)
+    if int(pd.__version__.split(".")[0]) < 3:
+        try:
+            pd.set_option("mode.copy_on_write", True)
+        except (KeyError, ValueError):
+            pass
+
+    frames = OrderedDict()
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            # The server went away
+            break
+        if message is None:
+            break
+        code, dataset_path = message
+        try:
+            local_vars = {"df": _load_dataset(dataset_path, frames).copy(deep=False), "px": px}
+            exec(code, {}, local_vars)
+            fig = local_vars.get("fig")
+            if not fig:
+                conn.send(("error", "⚠️ No chart generated. Ensure code assigns to `fig`."))
+            else:
+                conn.send(("ok", fig.to_json()))
+        except MemoryError:
+            frames.clear()
+            conn.send(("error", f"Chart code exceeded the {memory_limit_mb} MB worker memory limit."))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+
+if __name__ == "__main__":
+    worker_main(Connection(int(sys.argv[1])), int(sys.argv[2]))
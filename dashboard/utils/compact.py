@@ -0,0 +1,84 @@
+# ----------------------------
+# File: utils/compact.py
+# ----------------------------
+# Dtype compaction for frames loaded into a session: Mongo internals are
+# dropped, numerics are downcast and date columns parsed with the same rules
+# ingestion uses, repetitive strings become categoricals and the remaining
+# strings are Arrow-backed. A sensor table then takes a fraction of the
+# memory of the default object/float64/int64 layout.
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from utils.ingest import apply_schema, infer_schema
+from utils.tracing import traced
+
+# Strings with at most this share of distinct values are stored as categoricals
+CATEGORY_MAX_RATIO = 0.5
+ARROW_STRINGS = os.getenv("COMPACT_ARROW_STRINGS", "1").lower() in ("1", "true", "yes")
+MONGO_INTERNAL_COLUMNS = ("_id",)
+
+
+def _is_text(series):
+    return series.dtype == object or pd.api.types.is_string_dtype(series.dtype)
+
+
+@traced("pandas.compact_frame", rows=len, bytes=lambda df: int(df.memory_usage(index=False).sum()))
+def compact_frame(df):
+    """`df` with compact dtypes; returns a new frame and leaves `df` untouched."""
+    if df is None or df.empty:
+        return df
+    df = df.drop(columns=[col for col in MONGO_INTERNAL_COLUMNS if col in df.columns])
+    df = apply_schema(df, infer_schema(df))
+
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype) or not _is_text(series):
+            continue
+        try:
+            unique = series.nunique(dropna=True)
+        except TypeError:
+            # Unhashable values (nested documents, lists) stay as they are
+            continue
+        if unique <= max(1, len(series) * CATEGORY_MAX_RATIO):
+            df[col] = series.astype("category")
+        elif ARROW_STRINGS and series.dtype == object:
+            try:
+                df[col] = series.astype("string[pyarrow]")
+            except (TypeError, ValueError, ImportError):
+                pass
+    return df
+
+
+def _default_bytes(series):
+    # What the column would take as pandas builds it from Mongo documents: 8-byte numbers, Python strings
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return len(series)
+    if pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return len(series) * 8
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        counts = series.value_counts(dropna=True)
+        return len(series) * 8 + int(sum(sys.getsizeof(value) * count for value, count in counts.items()))
+    return int(series.astype(object).memory_usage(deep=True, index=False))
+
+
+def memory_report(df):
+    """Per-column dtype and memory, next to the size the default dtypes would need."""
+    rows = [
+        {
+            "Column": str(col),
+            "Dtype": str(df[col].dtype),
+            "Memory (MB)": df[col].memory_usage(deep=True, index=False) / 1e6,
+            "Default dtypes (MB)": _default_bytes(df[col]) / 1e6,
+        }
+        for col in df.columns
+    ]
+    report = pd.DataFrame(rows, columns=["Column", "Dtype", "Memory (MB)", "Default dtypes (MB)"])
+    return report.round(3) if not report.empty else report
+
+
+def memory_totals(report):
+    used, default = report["Memory (MB)"].sum(), report["Default dtypes (MB)"].sum()
+    return used, default, (1 - used / default) if default else np.nan
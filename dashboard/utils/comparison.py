@@ -0,0 +1,136 @@
+# ----------------------------
+# File: utils/comparison.py
+# ----------------------------
+# Time-aligned comparison of manual samples against WAMO sensor readings.
+# Both datasets are sorted and aligned once (nearest reading within a
+# tolerance, or averaged onto a common interval), then statistics for every
+# shared parameter are computed in a single vectorized pass. The multi-station
+# summary (averages, differences, trend slopes) is computed the same way.
+import numpy as np
+import pandas as pd
+
+from utils.tracing import traced
+
+
+def _prepare(df, time_col, columns):
+    out = df[[time_col] + columns].copy()
+    out[time_col] = pd.to_datetime(out[time_col], errors="coerce")
+    out = out.dropna(subset=[time_col]).rename(columns={time_col: "date"})
+    return out.sort_values("date", kind="mergesort")
+
+
+@traced("pandas.align_datasets", rows=len)
+def align_datasets(manual_df, wamo_df, manual_time, wamo_time, columns, tolerance="30min", method="asof"):
+    """Return one frame with `date` plus `<col>_manual` / `<col>_wamo` for every column in `columns`.
+
+    `method="asof"` matches each manual sample to the nearest sensor reading within `tolerance`;
+    `method="resample"` averages both sides onto a common `tolerance`-wide interval.
+    """
+    manual = _prepare(manual_df, manual_time, columns)
+    wamo = _prepare(wamo_df, wamo_time, columns)
+
+    if method == "resample":
+        manual = manual.groupby(manual["date"].dt.floor(tolerance))[columns].mean()
+        wamo = wamo.groupby(wamo["date"].dt.floor(tolerance))[columns].mean()
+        aligned = manual.join(wamo, how="inner", lsuffix="_manual", rsuffix="_wamo")
+        return aligned.rename_axis("date").reset_index()
+
+    manual = manual.add_suffix("_manual").rename(columns={"date_manual": "date"})
+    wamo = wamo.add_suffix("_wamo").rename(columns={"date_wamo": "date"})
+    wamo["wamo_date"] = wamo["date"]
+    aligned = pd.merge_asof(
+        manual,
+        wamo,
+        on="date",
+        direction="nearest",
+        tolerance=pd.Timedelta(tolerance),
+    )
+    return aligned.dropna(subset=["wamo_date"]).reset_index(drop=True)
+
+
+@traced("pandas.comparison_stats")
+def comparison_stats(aligned, columns):
+    """Per-parameter matched count, means, bias (manual − WAMO), RMSE and Pearson correlation."""
+    if aligned.empty or not columns:
+        return pd.DataFrame(columns=["Parameter", "Matched", "Manual Mean", "WAMO Mean", "Bias", "RMSE", "Correlation"])
+
+    manual = aligned[[f"{col}_manual" for col in columns]].to_numpy(dtype="float64")
+    wamo = aligned[[f"{col}_wamo" for col in columns]].to_numpy(dtype="float64")
+    both = ~(np.isnan(manual) | np.isnan(wamo))
+    matched = both.sum(axis=0)
+    safe = np.where(matched > 0, matched, 1)
+
+    manual_mean = np.where(both, manual, 0).sum(axis=0) / safe
+    wamo_mean = np.where(both, wamo, 0).sum(axis=0) / safe
+    diff = np.where(both, manual - wamo, 0)
+    bias = diff.sum(axis=0) / safe
+    rmse = np.sqrt((diff ** 2).sum(axis=0) / safe)
+
+    manual_dev = np.where(both, manual - manual_mean, 0)
+    wamo_dev = np.where(both, wamo - wamo_mean, 0)
+    denom = np.sqrt((manual_dev ** 2).sum(axis=0) * (wamo_dev ** 2).sum(axis=0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        correlation = np.where(denom > 0, (manual_dev * wamo_dev).sum(axis=0) / denom, np.nan)
+
+    empty = matched == 0
+    stats = pd.DataFrame({
+        "Parameter": columns,
+        "Matched": matched,
+        "Manual Mean": np.where(empty, np.nan, manual_mean),
+        "WAMO Mean": np.where(empty, np.nan, wamo_mean),
+        "Bias": np.where(empty, np.nan, bias),
+        "RMSE": np.where(empty, np.nan, rmse),
+        "Correlation": correlation,
+    })
+    return stats.round(4)
+
+
+def _column_stats(df, time_col, columns):
+    """Mean, least-squares slope per day and non-null count of every column, NaN-aware."""
+    frame = _prepare(df, time_col, columns)
+    values = frame[columns].to_numpy(dtype="float64")
+    days = ((frame["date"] - frame["date"].min()) / pd.Timedelta("1D")).to_numpy(dtype="float64")
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=0)
+    safe = np.where(count > 0, count, 1)
+
+    mean = np.where(valid, values, 0).sum(axis=0) / safe
+    day_mean = np.where(valid, days[:, None], 0).sum(axis=0) / safe
+    day_dev = np.where(valid, days[:, None] - day_mean, 0)
+    value_dev = np.where(valid, values - mean, 0)
+    spread = (day_dev ** 2).sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = np.where(spread > 0, (day_dev * value_dev).sum(axis=0) / spread, np.nan)
+    return np.where(count > 0, mean, np.nan), slope, count
+
+
+@traced("pandas.station_summary", rows=len)
+def station_summary(manual_df, manual_time, stations, columns):
+    """One row per station and shared parameter: averages, difference (manual − WAMO) and trends per day.
+
+    `stations` maps a station name to `(wamo_df, wamo_time)`.
+    """
+    header = ["Station", "Parameter", "Manual Avg", "WAMO Avg", "Difference", "Manual Trend /day", "WAMO Trend /day", "WAMO Readings"]
+    manual_mean, manual_slope, _ = _column_stats(manual_df, manual_time, columns)
+    manual = {col: (manual_mean[i], manual_slope[i]) for i, col in enumerate(columns)}
+
+    frames = []
+    for station, (wamo_df, wamo_time) in stations.items():
+        shared = [col for col in columns if col in wamo_df.columns and pd.api.types.is_numeric_dtype(wamo_df[col])]
+        if not shared or wamo_time is None:
+            continue
+        wamo_mean, wamo_slope, wamo_count = _column_stats(wamo_df, wamo_time, shared)
+        manual_avg = np.array([manual[col][0] for col in shared])
+        frames.append(pd.DataFrame({
+            "Station": station,
+            "Parameter": shared,
+            "Manual Avg": manual_avg,
+            "WAMO Avg": wamo_mean,
+            "Difference": manual_avg - wamo_mean,
+            "Manual Trend /day": [manual[col][1] for col in shared],
+            "WAMO Trend /day": wamo_slope,
+            "WAMO Readings": wamo_count,
+        }))
+    if not frames:
+        return pd.DataFrame(columns=header)
+    return pd.concat(frames, ignore_index=True).round(4)
@@ -0,0 +1,136 @@
+# ----------------------------
+# File: utils/conversation.py
+# ----------------------------
+# Bounded chat history for the assistant. Every request is the same
+# per-dataset system preamble (byte-identical across turns, so provider-side
+# prompt caching can reuse it), a short summary of older turns, then the most
+# recent turns with generated code and query-result dumps stripped. Once the
+# window overflows, the oldest turns are folded into the summary in one call,
+# so prompt size stays flat however long the session runs.
+import os
+import re
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from utils.prompt_context import CHARS_PER_TOKEN, estimate_tokens, log_prompt_size
+from utils.tracing import span
+
+# Recent turns sent verbatim (minus stripped blocks); a turn is one question plus everything it triggered
+CHAT_WINDOW_TURNS = int(os.getenv("CHAT_WINDOW_TURNS", 6))
+# Turns allowed past the window before the oldest are summarized together
+CHAT_FOLD_TURNS = int(os.getenv("CHAT_FOLD_TURNS", 4))
+CHAT_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", 3000))
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", 300))
+# Tables longer than DUMP_MIN_ROWS lines keep their first DUMP_KEEP_LINES (header included)
+DUMP_MIN_ROWS = 6
+DUMP_KEEP_LINES = 3
+
+FENCE = re.compile(r"```([A-Za-z]*)\s*(.*?)```", re.DOTALL)
+SEPARATORS = re.compile(r"[,|\t]")
+
+SUMMARY_INSTRUCTIONS = f"""You maintain the memory of a data-analysis chat about one dataset.
+Merge the earlier summary and the new exchanges into one summary of at most {CHAT_SUMMARY_TOKENS * 3 // 4} words.
+Keep the user's goals and preferences, the columns, filters and thresholds discussed, query results and findings
+that were stated, and which charts were made. Leave out code and raw data. Reply with the summary only."""
+
+
+def _strip_code(match):
+    language = match.group(1).lower() or "python"
+    return f"[{language} code omitted]"
+
+
+def _strip_dumps(text):
+    # A run of lines with the same number of separators is a table (CSV rows, markdown); keep its first rows only
+    out, run, width = [], 0, 0
+    for line in text.split("\n") + [""]:
+        separators = len(SEPARATORS.findall(line))
+        if separators and separators == width:
+            run += 1
+        else:
+            if run > DUMP_MIN_ROWS:
+                del out[-(run - DUMP_KEEP_LINES):]
+                out.append(f"[... {run - DUMP_KEEP_LINES} more rows omitted]")
+            run, width = 1, separators
+        out.append(line)
+    return "\n".join(out[:-1])
+
+
+def compact_message(message, keep_code=False):
+    """`message` as it should stay in history: data dumps trimmed and, unless `keep_code`, code blocks dropped."""
+    content = str(message.content)
+    if not keep_code:
+        content = FENCE.sub(_strip_code, content)
+    content = _strip_dumps(content)
+    if content == message.content:
+        return message
+    return AIMessage(content=content) if message.type == "ai" else HumanMessage(content=content)
+
+
+def _transcript(turns):
+    speaker = {"human": "User", "ai": "Assistant"}
+    return "\n".join(f"{speaker.get(m.type, m.type)}: {m.content}" for turn in turns for m in turn)
+
+
+class ChatMemory:
+    def __init__(self, dataset, window_turns=CHAT_WINDOW_TURNS, fold_turns=CHAT_FOLD_TURNS):
+        self.dataset = dataset
+        self.window_turns = window_turns
+        self.fold_turns = fold_turns
+        self.summary = ""
+        self.turns = []
+        self.current = []
+
+    def start_turn(self, question):
+        self.current = [HumanMessage(content=question)]
+
+    def add(self, message):
+        self.current.append(message)
+
+    def messages(self, preamble):
+        """Prompt for the next call: the stable preamble first, then memory, history and the turn in progress."""
+        messages = [SystemMessage(content=preamble)]
+        if self.summary:
+            messages.append(SystemMessage(content=f"Summary of the earlier conversation:\n{self.summary}"))
+        for turn in self.turns:
+            messages.extend(turn)
+        return messages + self.current
+
+    def end_turn(self, model, cache=None):
+        """Move the finished turn into history and fold the oldest turns into the summary when over budget."""
+        if not self.current:
+            return
+        # Only the latest answer keeps its code, so "change the colours" can still edit it
+        if self.turns:
+            self.turns[-1] = [compact_message(m) for m in self.turns[-1]]
+        self.turns.append([compact_message(m, keep_code=True) for m in self.current])
+        self.current = []
+
+        keep = len(self.turns)
+        if keep > self.window_turns + self.fold_turns:
+            keep = self.window_turns
+        while keep > 1 and sum(estimate_tokens(str(m.content)) for turn in self.turns[-keep:] for m in turn) > CHAT_HISTORY_TOKENS:
+            keep -= 1
+        if keep < len(self.turns):
+            self._fold(self.turns[:-keep], model, cache)
+            self.turns = self.turns[-keep:]
+
+    def _fold(self, turns, model, cache):
+        earlier = f"Earlier summary:\n{self.summary}\n\n" if self.summary else ""
+        messages = [
+            SystemMessage(content=SUMMARY_INSTRUCTIONS),
+            HumanMessage(content=f"{earlier}New exchanges:\n{_transcript(turns)}"),
+        ]
+        tokens = log_prompt_size("chat-memory", messages)
+        with span("llm.invoke", label="chat-memory", tokens=tokens, turns=len(turns)):
+            summary = cache.lookup(model, messages) if cache is not None else None
+            if summary is None:
+                try:
+                    summary = model.invoke(messages).content
+                    if cache is not None:
+                        cache.store(model, messages, summary)
+                except Exception:
+                    # Without the model, remember at least what was asked
+                    questions = [str(turn[0].content).split("\n")[0][:200] for turn in turns]
+                    summary = "\n".join([self.summary] * bool(self.summary) + [f"- User asked: {q}" for q in questions])
+        # The newest part of an overlong summary matters most
+        self.summary = summary.strip()[-CHAT_SUMMARY_TOKENS * CHARS_PER_TOKEN:]
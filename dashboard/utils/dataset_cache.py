@@ -0,0 +1,111 @@
+# ----------------------------
+# File: utils/dataset_cache.py
+# ----------------------------
+# Process-wide cache of loaded DataFrames, shared by every session on the
+# server. Entries are keyed by filename plus the stored dataset version, so a
+# re-upload never serves stale rows, and evicted least-recently-used first
+# once the memory budget is exceeded.
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import streamlit as st
+
+DEFAULT_BUDGET_MB = 1024
+
+
+def _size_of(value):
+    if hasattr(value, "memory_usage"):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+class DatasetCache:
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.current_bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, df):
+        size = _size_of(df)
+        with self._lock:
+            # A new version of a file replaces every older one
+            for stale in [k for k in self._entries if k[0] == key[0] and k[1] != key[1]]:
+                self._drop(stale)
+            if key in self._entries:
+                self._drop(key)
+            if size > self.budget_bytes:
+                return df
+            self._entries[key] = (df, size)
+            self.current_bytes += size
+            while self.current_bytes > self.budget_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return df
+
+    def get_or_load(self, key, loader):
+        df = self.get(key)
+        if df is None:
+            df = loader()
+            if df is not None:
+                self.put(key, df)
+        return df
+
+    def invalidate(self, filename):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == filename]:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _drop(self, key):
+        _, size = self._entries.pop(key)
+        self.current_bytes -= size
+
+
+@st.cache_resource
+def get_dataset_cache():
+    budget_mb = int(os.getenv("DATASET_CACHE_MB", DEFAULT_BUDGET_MB))
+    return DatasetCache(budget_mb * 1024 * 1024)
+
+
+def cached_derived(name, builder):
+    """Cache a value (frame, digest text, ...) derived from the active dataset under its filename and version."""
+    dataset_key = st.session_state.get("dataset_key")
+    if dataset_key is None:
+        return builder()
+    return get_dataset_cache().get_or_load((*dataset_key, name, None), builder)
@@ -0,0 +1,91 @@
+# ----------------------------
+# File: utils/distribution.py
+# ----------------------------
+# NumPy distribution plot used in place of `ff.create_distplot`. The histogram
+# uses Freedman–Diaconis bin widths, the KDE is a linearly binned Gaussian
+# convolution on a fixed grid (via FFT), and the rug is a bounded sample, so
+# both cost and payload stay flat as the column grows.
+import numpy as np
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+KDE_GRID_POINTS = 512
+MAX_BINS = 200
+RUG_SAMPLE = 500
+
+
+def freedman_diaconis_edges(values):
+    q1, q3 = np.percentile(values, [25, 75])
+    lo, hi = values.min(), values.max()
+    if hi == lo:
+        return np.array([lo - 0.5, hi + 0.5])
+    width = 2 * (q3 - q1) * len(values) ** (-1 / 3)
+    bins = int(np.ceil((hi - lo) / width)) if width > 0 else int(np.ceil(np.sqrt(len(values))))
+    return np.linspace(lo, hi, min(max(bins, 1), MAX_BINS) + 1)
+
+
+def silverman_bandwidth(values):
+    std = values.std(ddof=1) if len(values) > 1 else 0.0
+    q1, q3 = np.percentile(values, [25, 75])
+    spread = min(std, (q3 - q1) / 1.34) or std or 1.0
+    return 0.9 * spread * len(values) ** (-0.2)
+
+
+def binned_kde(values, grid_points=KDE_GRID_POINTS, bandwidth=None):
+    """Gaussian KDE evaluated on `grid_points` evenly spaced x-values. Returns `(grid, density)`."""
+    bw = bandwidth or silverman_bandwidth(values)
+    lo, hi = values.min() - 3 * bw, values.max() + 3 * bw
+    grid = np.linspace(lo, hi, grid_points)
+    delta = grid[1] - grid[0]
+
+    # Linear binning: split each observation between its two neighbouring grid points
+    pos = (values - lo) / delta
+    left = np.clip(np.floor(pos).astype(np.int64), 0, grid_points - 2)
+    frac = pos - left
+    counts = np.bincount(left, weights=1 - frac, minlength=grid_points)
+    counts += np.bincount(left + 1, weights=frac, minlength=grid_points)
+
+    reach = min(grid_points - 1, int(np.ceil(4 * bw / delta)))
+    offsets = np.arange(-reach, reach + 1) * delta
+    kernel = np.exp(-0.5 * (offsets / bw) ** 2) / (bw * np.sqrt(2 * np.pi))
+
+    size = 1 << int(np.ceil(np.log2(grid_points + 2 * reach + 1)))
+    smoothed = np.fft.irfft(np.fft.rfft(counts, size) * np.fft.rfft(kernel, size), size)
+    density = np.clip(smoothed[reach:reach + grid_points], 0, None) / len(values)
+    return grid, density
+
+
+def sampled_rug(values, max_points=RUG_SAMPLE, seed=0):
+    if len(values) <= max_points:
+        return values
+    return np.random.default_rng(seed).choice(values, size=max_points, replace=False)
+
+
+def distribution_figure(values, name, color):
+    """Histogram (density), KDE curve and rug for a 1-D numeric array, laid out like `create_distplot`."""
+    values = np.asarray(values, dtype="float64")
+    counts, edges = np.histogram(values, bins=freedman_diaconis_edges(values), density=True)
+    grid, density = binned_kde(values)
+    rug = sampled_rug(values)
+
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.8, 0.2], vertical_spacing=0.02)
+    fig.add_trace(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2,
+        y=counts,
+        width=np.diff(edges),
+        name=name,
+        marker=dict(color=color, line=dict(width=0)),
+        opacity=0.7,
+        legendgroup=name,
+    ), row=1, col=1)
+    fig.add_trace(go.Scatter(
+        x=grid, y=density, mode="lines", name=f"{name} KDE",
+        line=dict(color=color, width=2), legendgroup=name,
+    ), row=1, col=1)
+    fig.add_trace(go.Scatter(
+        x=rug, y=[name] * len(rug), mode="markers", name=f"{name} rug",
+        marker=dict(color=color, symbol="line-ns-open"), legendgroup=name, showlegend=False,
+    ), row=2, col=1)
+    fig.update_layout(bargap=0)
+    fig.update_yaxes(showticklabels=False, row=2, col=1)
+    return fig
@@ -0,0 +1,98 @@
+# ----------------------------
+# File: utils/downsample.py
+# ----------------------------
+# Server-side downsampling for time-series charts. Series are reduced to a
+# fixed point budget (LTTB or min/max per bucket) before they are handed to
+# Plotly, so the JSON payload no longer grows with dataset length. Points
+# passed in `keep_mask` (e.g. outliers) always survive.
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+DEFAULT_TARGET_POINTS = 2_000
+WEBGL_THRESHOLD = 1_000
+
+
+def _as_float(values):
+    values = pd.Series(values) if not isinstance(values, pd.Series) else values
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.astype("datetime64[ns]").astype("int64").to_numpy(dtype="float64")
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype="float64")
+    # Categorical / string x: fall back to row order
+    return np.arange(len(values), dtype="float64")
+
+
+def lttb_indices(x, y, target_points):
+    """Largest-Triangle-Three-Buckets: positions of `target_points` visually representative points."""
+    n = len(y)
+    if target_points >= n or target_points < 3:
+        return np.arange(n)
+
+    selected = np.empty(target_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    every = (n - 2) / (target_points - 2)
+    previous = 0
+    for i in range(target_points - 2):
+        start = int(i * every) + 1
+        stop = int((i + 1) * every) + 1
+        next_start = stop
+        next_stop = min(int((i + 2) * every) + 1, n)
+        if next_stop <= next_start:
+            next_start, next_stop = n - 1, n
+        avg_x = x[next_start:next_stop].mean()
+        avg_y = y[next_start:next_stop].mean()
+        area = np.abs(
+            (x[previous] - avg_x) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+    return selected
+
+
+def minmax_indices(y, target_points):
+    """Keep the minimum and maximum of each bucket, so spikes are never smoothed away."""
+    n = len(y)
+    buckets = max(target_points // 2, 1)
+    if target_points >= n:
+        return np.arange(n)
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    picks = []
+    for start, stop in zip(edges[:-1], edges[1:]):
+        if stop > start:
+            window = y[start:stop]
+            picks.extend((start + int(np.argmin(window)), start + int(np.argmax(window))))
+    return np.unique(picks)
+
+
+def downsample_indices(x, y, target_points=DEFAULT_TARGET_POINTS, method="lttb", keep_mask=None):
+    """Positional indices to plot: reduced series plus every position flagged in `keep_mask`."""
+    y_values = _as_float(y)
+    valid = np.flatnonzero(~np.isnan(y_values))
+    if len(valid) <= target_points:
+        chosen = valid
+    else:
+        x_values = _as_float(x)[valid]
+        if method == "minmax":
+            local = minmax_indices(y_values[valid], target_points)
+        else:
+            local = lttb_indices(x_values, y_values[valid], target_points)
+        chosen = valid[local]
+    if keep_mask is not None:
+        chosen = np.union1d(chosen, np.flatnonzero(np.asarray(keep_mask, dtype=bool)))
+    return chosen
+
+
+def downsample_frame(df, x_col, y_cols, target_points=DEFAULT_TARGET_POINTS, method="lttb", keep_mask=None):
+    """Reduce `df` to the union of the points each of `y_cols` needs against `x_col`."""
+    if len(df) <= target_points:
+        return df
+    positions = [downsample_indices(df[x_col], df[col], target_points, method, keep_mask) for col in y_cols]
+    return df.iloc[np.unique(np.concatenate(positions))] if positions else df
+
+
+def make_scatter(x, y, **kwargs):
+    """`go.Scatter`, or `go.Scattergl` once the trace is large enough to benefit from WebGL."""
+    trace_cls = go.Scattergl if len(x) > WEBGL_THRESHOLD else go.Scatter
+    return trace_cls(x=x, y=y, **kwargs)
@@ -0,0 +1,84 @@
+# ----------------------------
+# File: utils/figure_cache.py
+# ----------------------------
+# Process-wide cache of built figures as Plotly JSON, keyed by the dataset's
+# filename and version plus a digest of what produced the figure (normalized
+# chart code, or the manual builder's parameters). A rerun that doesn't change
+# those inputs skips exec, pandas and Plotly Express and only rehydrates the
+# JSON. Entries share the dataset cache's LRU eviction and version handling.
+# Rehydrated figures carry plain lists (timestamps as strings), which are
+# slower to load and to render than a freshly built figure's typed arrays, so
+# figures built in this process are only cached while they stay small.
+import hashlib
+import json
+import os
+
+import plotly.graph_objects as go
+import streamlit as st
+
+from utils.dataset_cache import DatasetCache
+from utils.tracing import span
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+DEFAULT_FIGURE_BUDGET_MB = 128
+# Above this many points an in-process rebuild beats loading the cached JSON
+FIGURE_CACHE_MAX_POINTS = int(os.getenv("FIGURE_CACHE_MAX_POINTS", 100_000))
+
+
+@st.cache_resource
+def get_figure_cache():
+    budget_mb = int(os.getenv("FIGURE_CACHE_MB", DEFAULT_FIGURE_BUDGET_MB))
+    return DatasetCache(budget_mb * 1024 * 1024)
+
+
+def normalize_code(code):
+    # Whitespace, blank lines and comment-only lines don't change the figure
+    lines = (line.rstrip() for line in code.strip().splitlines())
+    return "\n".join(line for line in lines if line.strip() and not line.lstrip().startswith("#"))
+
+
+def figure_points(fig):
+    total = 0
+    for trace in fig.data:
+        lengths = [len(values) for values in (getattr(trace, axis, None) for axis in ("x", "y", "z", "values")) if values is not None]
+        total += max(lengths, default=0)
+    return total
+
+
+def figure_from_json(text):
+    # Cached JSON came from a figure that was validated when it was built; skipping validation is most of the saving
+    return go.Figure(_loads(text), _validate=False)
+
+
+def cached_figure(kind, spec, builder):
+    """Figure for `spec` under the active dataset version; `builder` runs on a miss.
+
+    `builder` returns a figure or its JSON (what chart workers send back), or None on
+    failure, which is not cached. Figures over FIGURE_CACHE_MAX_POINTS are cached only
+    as worker JSON, which a hit saves the round trip for.
+    """
+    dataset_key = st.session_state.get("dataset_key")
+    if dataset_key is None:
+        built = builder()
+        return figure_from_json(built) if isinstance(built, str) else built
+
+    cache = get_figure_cache()
+    key = (*dataset_key, kind, hashlib.sha1(repr(spec).encode("utf-8")).hexdigest())
+    text = cache.get(key)
+    if text is None:
+        built = builder()
+        if built is None:
+            return None
+        if not isinstance(built, str):
+            # A freshly built figure is returned as is; only later reruns rehydrate it
+            if figure_points(built) <= FIGURE_CACHE_MAX_POINTS:
+                cache.put(key, built.to_json())
+            return built
+        text = cache.put(key, built)
+    with span("figure_cache.load", bytes=len(text)):
+        return figure_from_json(text)
@@ -0,0 +1,333 @@
+# ----------------------------
+# File: utils/ingest.py
+# ----------------------------
+# Streaming ingestion for uploaded CSV/Excel files. The file is read in
+# chunks, the schema is inferred and locked from the first chunk, and every
+# chunk is written to storage as soon as it is parsed, so peak memory is
+# bounded by the chunk size rather than the file size. Appending a newer
+# export to a stored dataset writes only the rows whose timestamps aren't
+# stored yet and folds their statistics into the stored profile.
+import datetime
+import hashlib
+import warnings
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+from utils.profile import (
+    find_time_column, load_profile_state, merge_states, profile_state, save_profile, time_ns, with_time_state
+)
+from utils.storage import (
+    STORAGE_FORMAT, begin_dataset, write_chunk, finish_dataset, delete_dataset, decode_chunk, read_dataset,
+    dataset_version, time_bounds
+)
+
+DEFAULT_CHUNK_ROWS = 100_000
+HASH_BLOCK_BYTES = 4 * 1024 * 1024
+DATE_PARSE_THRESHOLD = 0.9
+
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    file.seek(0)
+    for block in iter(lambda: file.read(HASH_BLOCK_BYTES), b""):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def _is_date_name(col):
+    return "date" in str(col).lower() or "time" in str(col).lower()
+
+
+def infer_schema(chunk):
+    # Returns {column: ("datetime", format) | ("numeric", dtype) | ("keep", None)}
+    schema = {}
+    for col in chunk.columns:
+        series = chunk[col]
+        if pd.api.types.is_bool_dtype(series):
+            schema[col] = ("keep", None)
+        elif pd.api.types.is_integer_dtype(series):
+            schema[col] = ("numeric", pd.to_numeric(series, downcast="integer").dtype)
+        elif pd.api.types.is_float_dtype(series):
+            schema[col] = ("numeric", pd.to_numeric(series, downcast="float").dtype)
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            schema[col] = ("datetime", None)
+        elif _is_date_name(col):
+            schema[col] = _infer_datetime(series)
+        else:
+            schema[col] = ("keep", None)
+    return schema
+
+
+def _infer_datetime(series):
+    non_null = series.dropna().astype(str)
+    if non_null.empty:
+        return ("keep", None)
+    sample = non_null.iloc[0]
+    day_first = guess_datetime_format(sample, dayfirst=True)
+    month_first = guess_datetime_format(sample)
+    # A leading day wins ties (European dd.mm.yyyy); ISO dates keep year-month-day
+    ordered = (day_first, month_first) if day_first and day_first.startswith("%d") else (month_first, day_first)
+    candidates = dict.fromkeys(fmt for fmt in ordered if fmt)
+    best_fmt, best_rate = None, 0.0
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        for fmt in list(candidates) or [None]:
+            rate = pd.to_datetime(non_null, format=fmt, errors="coerce").notna().mean()
+            if rate > best_rate:
+                best_fmt, best_rate = fmt, rate
+    if best_rate >= DATE_PARSE_THRESHOLD:
+        return ("datetime", best_fmt)
+    return ("keep", None)
+
+
+def _fits(series, dtype):
+    if not pd.api.types.is_numeric_dtype(series):
+        return False
+    if pd.api.types.is_integer_dtype(dtype):
+        if series.isna().any():
+            return False
+        info = np.iinfo(dtype)
+        return series.empty or (series.min() >= info.min and series.max() <= info.max)
+    return True
+
+
+def apply_schema(chunk, schema):
+    for col, (kind, spec) in schema.items():
+        if col not in chunk.columns:
+            continue
+        if kind == "datetime":
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", UserWarning)
+                chunk[col] = pd.to_datetime(chunk[col], format=spec, errors="coerce")
+        elif kind == "numeric":
+            if _fits(chunk[col], spec):
+                chunk[col] = chunk[col].astype(spec)
+            elif pd.api.types.is_numeric_dtype(chunk[col]):
+                # A later chunk doesn't fit the locked dtype: widen the lock once
+                schema[col] = ("numeric", np.dtype("float64"))
+                chunk[col] = chunk[col].astype("float64")
+            else:
+                schema[col] = ("keep", None)
+    return chunk
+
+
+def schema_to_doc(schema):
+    # A list of triples: column names may contain "." or "$", which Mongo keys can't
+    return [[col, kind, str(spec) if spec is not None else None] for col, (kind, spec) in schema.items()]
+
+
+def schema_from_doc(doc):
+    return {col: (kind, np.dtype(spec) if kind == "numeric" else spec) for col, kind, spec in doc}
+
+
+def _iter_csv(file, chunk_rows):
+    return pd.read_csv(file, chunksize=chunk_rows)
+
+
+def _iter_excel(file, chunk_rows):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        load_workbook = None
+
+    if load_workbook is None or file.name.endswith(".xls"):
+        df = pd.read_excel(file)
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows].reset_index(drop=True)
+        return
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    rows = workbook.worksheets[0].iter_rows(values_only=True)
+    header = [str(col) if col is not None else f"Unnamed: {i}" for i, col in enumerate(next(rows, []))]
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == chunk_rows:
+            yield pd.DataFrame.from_records(batch, columns=header).infer_objects()
+            batch = []
+    if batch:
+        yield pd.DataFrame.from_records(batch, columns=header).infer_objects()
+    workbook.close()
+
+
+def iter_upload_chunks(file, chunk_rows=DEFAULT_CHUNK_ROWS):
+    file.seek(0)
+    if file.name.endswith(".csv"):
+        return _iter_csv(file, chunk_rows)
+    return _iter_excel(file, chunk_rows)
+
+
+def _settle_time_state(state, meta, upload_collection, chunk_collection):
+    # Chunks whose time ranges interleave can't merge their spacing; rescan the time column alone
+    if not state or not state.get("time_stale"):
+        return state
+    time_col = state["time"]["column"] if state.get("time") else meta.get("time_column")
+    times = read_dataset(meta["filename"], upload_collection, chunk_collection, columns=[time_col], meta=meta)
+    return with_time_state(state, times[time_col], time_col)
+
+
+def ingest_upload(file, upload_collection, chunk_collection, chunk_rows=DEFAULT_CHUNK_ROWS, progress=None,
+                  profile_collection=None):
+    """Stream `file` into chunked storage. Returns `(status, meta)` with status "duplicate" or "stored".
+
+    With `profile_collection`, the profile is built chunk by chunk and stored with the upload.
+    """
+    file_hash = content_hash(file)
+    duplicate = upload_collection.find_one({"content_hash": file_hash, "status": "ready"}, {"data": 0})
+    if duplicate:
+        return "duplicate", duplicate
+
+    total_bytes = getattr(file, "size", None)
+    upload_id = begin_dataset(file.name, upload_collection, extra={"content_hash": file_hash})
+    schema = None
+    time_column = None
+    state = None
+    row_count = 0
+    num_chunks = 0
+    dtypes = {}
+    try:
+        for chunk in iter_upload_chunks(file, chunk_rows):
+            if schema is None:
+                schema = infer_schema(chunk)
+            chunk = apply_schema(chunk, schema)
+            if num_chunks == 0:
+                time_column = find_time_column(chunk)
+            row_count += write_chunk(upload_id, num_chunks, row_count, chunk, chunk_collection, time_column)
+            num_chunks += 1
+            dtypes = chunk.dtypes.to_dict()
+            if profile_collection is not None:
+                state = merge_states(state, profile_state(chunk))
+            if progress:
+                fraction = min(file.tell() / total_bytes, 1.0) if total_bytes and file.name.endswith(".csv") else None
+                progress(row_count, fraction)
+    except Exception:
+        delete_dataset(upload_id, upload_collection, chunk_collection)
+        raise
+
+    columns = list(dtypes.keys())
+    extra = {"schema": schema_to_doc(schema or {}), "time_column": time_column}
+    finish_dataset(upload_id, upload_collection, row_count, num_chunks, columns, dtypes, extra=extra)
+
+    # Same filename with new content replaces the previous version
+    replaced = [
+        doc["_id"] for doc in upload_collection.find({"filename": file.name, "_id": {"$ne": upload_id}}, {"_id": 1})
+    ]
+    for old_id in replaced:
+        delete_dataset(old_id, upload_collection, chunk_collection)
+
+    meta = upload_collection.find_one({"_id": upload_id}, {"data": 0})
+    if state is not None:
+        state = _settle_time_state(state, meta, upload_collection, chunk_collection)
+        save_profile(meta, dataset_version(meta), state, profile_collection)
+    return "stored", meta
+
+
+def _stored_time_column(meta):
+    # Uploads stored before `time_column` was recorded
+    dtypes = meta.get("dtypes", {})
+    for col, dtype in dtypes.items():
+        if dtype.startswith("datetime64"):
+            return col
+    return next((col for col in meta.get("columns", []) if _is_date_name(col)), None)
+
+
+def _backfill_time_bounds(upload_id, time_column, chunk_collection):
+    # One-time pass over chunks written before chunks carried their time range
+    for chunk in chunk_collection.find({"upload_id": upload_id, "time_min": None}, {"data": 1}):
+        bounds = time_bounds(decode_chunk(chunk["data"], [time_column])[time_column])
+        chunk_collection.update_one({"_id": chunk["_id"]}, {"$set": bounds})
+
+
+def new_rows(chunk, time_column, upload_id, chunk_collection):
+    """Rows of `chunk` whose timestamp isn't stored yet, first occurrence only; unparseable times are dropped."""
+    ns, valid = time_ns(chunk[time_column])
+    keep = valid & ~pd.Series(ns).duplicated().to_numpy()
+    if keep.any():
+        # Only stored chunks whose time range overlaps this one can hold its timestamps
+        query = {"upload_id": upload_id, "time_min": {"$lte": int(ns[keep].max())}, "time_max": {"$gte": int(ns[keep].min())}}
+        for stored in chunk_collection.find(query, {"data": 1}):
+            stored_ns, stored_valid = time_ns(decode_chunk(stored["data"], [time_column])[time_column])
+            keep &= ~np.isin(ns, stored_ns[stored_valid])
+    return chunk[keep]
+
+
+def append_upload(file, meta, upload_collection, chunk_collection, chunk_rows=DEFAULT_CHUNK_ROWS, progress=None,
+                  profile_collection=None):
+    """Append the rows of `file` with timestamps not yet stored to the dataset `meta`.
+
+    Returns `(status, meta)` with status "duplicate" or "appended"; `meta["last_append"]` holds
+    the rows added and skipped. Cost follows the size of `file` plus the stored chunks its time
+    range overlaps. The stored profile is updated from the appended rows alone when its state
+    is current, otherwise it is recomputed on the next view.
+    """
+    if meta.get("storage") != STORAGE_FORMAT:
+        raise ValueError("This dataset uses the old storage format; upload it again before appending to it.")
+    file_hash = content_hash(file)
+    if file_hash == meta.get("content_hash") or file_hash in meta.get("appended_hashes", []):
+        return "duplicate", meta
+    time_column = meta.get("time_column") or _stored_time_column(meta)
+    if time_column is None:
+        raise ValueError("Appending needs a date/time column to tell new rows from stored ones.")
+
+    upload_id = meta["_id"]
+    _backfill_time_bounds(upload_id, time_column, chunk_collection)
+    total_bytes = getattr(file, "size", None)
+    schema = schema_from_doc(meta["schema"]) if meta.get("schema") else None
+    row_count, num_chunks = meta["row_count"], meta["num_chunks"]
+    columns = list(meta.get("columns", []))
+    dtypes = dict(meta.get("dtypes", {}))
+    state = None
+    skipped = 0
+    try:
+        for chunk in iter_upload_chunks(file, chunk_rows):
+            if schema is None:
+                schema = infer_schema(chunk)
+            chunk = apply_schema(chunk, schema)
+            if time_column not in chunk.columns:
+                raise ValueError(f"The file has no '{time_column}' column to match against the stored rows.")
+            fresh = new_rows(chunk, time_column, upload_id, chunk_collection)
+            skipped += len(chunk) - len(fresh)
+            if len(fresh):
+                row_count += write_chunk(upload_id, num_chunks, row_count, fresh, chunk_collection, time_column)
+                num_chunks += 1
+                columns += [str(col) for col in fresh.columns if str(col) not in columns]
+                dtypes.update({str(col): str(dtype) for col, dtype in fresh.dtypes.items()})
+                if profile_collection is not None:
+                    state = merge_states(state, profile_state(fresh))
+            if progress:
+                fraction = min(file.tell() / total_bytes, 1.0) if total_bytes and file.name.endswith(".csv") else None
+                progress(row_count - meta["row_count"], fraction)
+    except Exception:
+        # Chunks past the stored num_chunks are invisible to readers until the update below
+        chunk_collection.delete_many({"upload_id": upload_id, "chunk_index": {"$gte": meta["num_chunks"]}})
+        raise
+
+    added = row_count - meta["row_count"]
+    now = datetime.datetime.utcnow()
+    update = {
+        "appended_hashes": meta.get("appended_hashes", []) + [file_hash],
+        "last_append": {"at": now, "rows_added": int(added), "rows_skipped": int(skipped)},
+    }
+    if added:
+        update.update({
+            "updated_at": now,
+            "row_count": int(row_count),
+            "num_chunks": int(num_chunks),
+            "columns": columns,
+            "dtypes": dtypes,
+            "schema": schema_to_doc(schema),
+            "time_column": time_column,
+        })
+    upload_collection.update_one({"_id": upload_id}, {"$set": update})
+    previous_version = dataset_version(meta)
+    meta = upload_collection.find_one({"_id": upload_id}, {"data": 0})
+
+    if added and profile_collection is not None:
+        previous = load_profile_state(upload_id, previous_version, profile_collection)
+        if previous is not None:
+            state = _settle_time_state(merge_states(previous, state), meta, upload_collection, chunk_collection)
+            save_profile(meta, dataset_version(meta), state, profile_collection)
+    return "appended", meta
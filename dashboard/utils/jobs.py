@@ -0,0 +1,271 @@
+# ----------------------------
+# File: utils/jobs.py
+# ----------------------------
+# Background jobs for heavy dataset work (ingestion, profiling, WAMO
+# comparison, LLM summaries). Jobs live in a Mongo collection, so they
+# survive reruns, page reloads and server restarts, and a pool of worker
+# threads per server claims them one at a time. A job is keyed by its kind,
+# dataset version and parameters: a second session asking for the same work
+# gets the running or finished job instead of starting another. Tabs poll a
+# job's status, progress and partial output from a fragment and render the
+# result once it lands.
+import datetime
+import hashlib
+import io
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_POLL_S = float(os.getenv("JOB_POLL_S", 1.0))
+# A running job whose worker hasn't reported for this long is handed to another worker
+JOB_STALE_S = float(os.getenv("JOB_STALE_S", 300))
+# Workers refresh a running job's heartbeat this often, also during long steps that report no progress
+JOB_HEARTBEAT_S = float(os.getenv("JOB_HEARTBEAT_S", JOB_STALE_S / 5))
+JOB_TTL_HOURS = float(os.getenv("JOB_TTL_HOURS", 24 * 7))
+JOB_SPOOL_DIR = os.getenv("JOB_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "dashboard-jobs"))
+
+ACTIVE = ("queued", "running")
+FINISHED = ("done", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def job_key(kind, dataset, params):
+    payload = json.dumps([kind, dataset, params], sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def frame_to_doc(df):
+    # Small result tables only; values become plain Python types Mongo can store, missing ones None (BSON has no NaT)
+    split = df.astype(object).where(df.notna(), None).to_dict("split")
+    return {"columns": [str(col) for col in split["columns"]], "data": split["data"]}
+
+
+def frame_from_doc(doc):
+    return pd.DataFrame(doc["data"], columns=doc["columns"])
+
+
+def spool_upload(file):
+    """Copy an upload to local disk so a worker can read it after this rerun ends; returns the path."""
+    os.makedirs(JOB_SPOOL_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=JOB_SPOOL_DIR, suffix=os.path.splitext(file.name)[1])
+    file.seek(0)
+    with os.fdopen(fd, "wb") as out:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            out.write(block)
+    file.seek(0)
+    return path
+
+
+class SpooledUpload(io.BufferedReader):
+    """A spooled upload reopened by a worker: read from disk in blocks, under the upload's name and size."""
+
+    def __init__(self, path, name):
+        super().__init__(io.FileIO(path, "rb"))
+        self.upload_name = name
+        self.size = os.path.getsize(path)
+
+    @property
+    def name(self):
+        return self.upload_name
+
+
+class JobContext:
+    """Handed to a handler: reports progress and partial output, and stops the job once cancelled."""
+
+    def __init__(self, collection, job):
+        self.collection = collection
+        self.job_id = job["_id"]
+        self.dataset = job.get("dataset")
+        # Set when the job was submitted to redo finished work (e.g. "Regenerate")
+        self.refresh = job.get("refresh", False)
+
+    def progress(self, fraction=None, message=None, partial=None):
+        update = {"heartbeat_at": datetime.datetime.utcnow()}
+        if fraction is not None:
+            update["progress"] = float(fraction)
+        if message is not None:
+            update["message"] = message
+        if partial is not None:
+            update["partial"] = partial
+        doc = self.collection.find_one_and_update(
+            {"_id": self.job_id}, {"$set": update}, projection={"cancel_requested": 1}
+        )
+        if doc is None or doc.get("cancel_requested"):
+            raise JobCancelled()
+
+
+class JobQueue:
+    def __init__(self, collection, workers=JOB_WORKERS):
+        self.collection = collection
+        self.workers = workers
+        self.handlers = {}
+        self.host = socket.gethostname()
+        self.worker_id = f"{self.host}:{os.getpid()}"
+        self._started = False
+        self._lock = threading.Lock()
+        # At most one queued or running job per key; finished jobs drop the field
+        self.collection.create_index("active_key", unique=True, sparse=True)
+        self.collection.create_index([("key", 1), ("created_at", -1)])
+        self.collection.create_index([("status", 1), ("created_at", 1)])
+        try:
+            self.collection.create_index("finished_at", expireAfterSeconds=int(JOB_TTL_HOURS * 3600))
+        except OperationFailure:
+            pass
+
+    def register(self, kind, handler):
+        # `handler(ctx, **params)` returns a BSON-encodable result
+        self.handlers[kind] = handler
+
+    def submit(self, kind, dataset=None, params=None, refresh=False, local=False):
+        """Id of the job doing this work: an active or finished one with the same key, else a new one.
+
+        A failed or cancelled job is reused too, so its error stays put instead of the work
+        restarting on every rerun; with `refresh` (an explicit retry), finished jobs are not reused. A `local` job is only claimed by workers
+        on this host, for params that point at local files (e.g. a spooled upload).
+        """
+        params = params or {}
+        key = job_key(kind, dataset, params)
+        if not refresh:
+            # The newest job for a key is the active one, if any
+            existing = self.collection.find_one({"key": key}, {"_id": 1}, sort=[("created_at", -1)])
+            if existing:
+                return existing["_id"]
+        now = datetime.datetime.utcnow()
+        try:
+            return self.collection.insert_one({
+                "kind": kind,
+                "dataset": dataset,
+                "params": params,
+                "key": key,
+                "active_key": key,
+                "status": "queued",
+                "progress": 0.0,
+                "refresh": refresh,
+                "host": self.host if local else None,
+                "created_at": now,
+                "heartbeat_at": now,
+            }).inserted_id
+        except DuplicateKeyError:
+            # Another session queued the same work a moment ago
+            return self.collection.find_one({"active_key": key}, {"_id": 1})["_id"]
+
+    def get(self, job_id):
+        return self.collection.find_one({"_id": job_id})
+
+    def cancel(self, job_id):
+        now = datetime.datetime.utcnow()
+        # A queued job is cancelled at once; a running one stops at its next progress report
+        self.collection.update_one(
+            {"_id": job_id, "status": "queued"},
+            {"$set": {"status": "cancelled", "finished_at": now}, "$unset": {"active_key": ""}},
+        )
+        self.collection.update_one({"_id": job_id, "status": "running"}, {"$set": {"cancel_requested": True}})
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True).start()
+
+    def _claim(self):
+        now = datetime.datetime.utcnow()
+        stale = now - datetime.timedelta(seconds=JOB_STALE_S)
+        # Queued jobs, or running ones whose worker died with its server; local jobs stay on their host
+        return self.collection.find_one_and_update(
+            {
+                "$or": [{"status": "queued"}, {"status": "running", "heartbeat_at": {"$lt": stale}}],
+                "host": {"$in": [None, self.host]},
+            },
+            {"$set": {"status": "running", "worker": self.worker_id, "started_at": now, "heartbeat_at": now}},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _finish(self, job_id, status, **fields):
+        fields.update(status=status, finished_at=datetime.datetime.utcnow())
+        self.collection.update_one({"_id": job_id}, {"$set": fields, "$unset": {"active_key": ""}})
+
+    def _work(self):
+        while True:
+            try:
+                job = self._claim()
+            except Exception:
+                time.sleep(JOB_POLL_S)
+                continue
+            if job is None:
+                time.sleep(JOB_POLL_S)
+                continue
+            self._run(job)
+
+    def _heartbeat(self, job_id, stop):
+        # Keeps a job that is busy in one long call (e.g. profiling) from looking abandoned
+        while not stop.wait(JOB_HEARTBEAT_S):
+            try:
+                self.collection.update_one(
+                    {"_id": job_id, "status": "running"}, {"$set": {"heartbeat_at": datetime.datetime.utcnow()}}
+                )
+            except Exception:
+                pass
+
+    def _run(self, job):
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            self._finish(job["_id"], "failed", error=f"No handler for {job['kind']} jobs.")
+            return
+        stop = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job["_id"], stop), name="job-heartbeat", daemon=True).start()
+        try:
+            result = handler(JobContext(self.collection, job), **job["params"])
+        except JobCancelled:
+            self._finish(job["_id"], "cancelled")
+        except Exception as e:
+            self._finish(job["_id"], "failed", error=str(e) or type(e).__name__)
+        else:
+            self._finish(job["_id"], "done", result=result, progress=1.0)
+        finally:
+            stop.set()
+
+
+@st.cache_resource
+def get_job_queue(_collection):
+    # Workers start once the app has registered its handlers (JobQueue.start)
+    return JobQueue(_collection)
+
+
+@st.fragment(run_every=JOB_POLL_S)
+def _job_progress(queue, job_id, label):
+    job = queue.get(job_id)
+    if job is None or job["status"] in FINISHED:
+        # The full rerun renders the result in place of this fragment
+        st.rerun()
+    text = f"⏳ {label}: {job.get('message') or ('waiting for a worker' if job['status'] == 'queued' else 'running')}..."
+    st.progress(min(max(job.get("progress") or 0.0, 0.0), 1.0), text=text)
+    if job.get("partial"):
+        st.markdown(job["partial"] + "▌")
+    if st.button("✖️ Cancel", key=f"cancel_job_{job_id}"):
+        queue.cancel(job_id)
+
+
+def wait_for_job(queue, job_id, label):
+    """The finished job, or None after showing live progress that polls until it finishes."""
+    job = queue.get(job_id)
+    if job is None:
+        return {"_id": job_id, "status": "failed", "error": "The job has expired; reload the page to run it again."}
+    if job["status"] in FINISHED:
+        return job
+    _job_progress(queue, job_id, label)
+    return None
@@ -0,0 +1,133 @@
+# ----------------------------
+# File: utils/llm_cache.py
+# ----------------------------
+# Content-addressed cache for LLM responses, persisted in Mongo. The key is a
+# hash of the model name plus every message sent, so the same dataset and
+# prompt never reaches Groq twice until the entry expires or is evicted.
+import datetime
+import hashlib
+import json
+import os
+import threading
+
+import streamlit as st
+from langchain_core.messages import AIMessage
+from pymongo.errors import OperationFailure
+
+from utils.prompt_context import log_prompt_size
+from utils.tracing import span
+
+DEFAULT_TTL_HOURS = 24 * 7
+DEFAULT_MAX_ENTRIES = 5_000
+
+
+def model_name(model):
+    return getattr(model, "model_name", None) or getattr(model, "model", None) or type(model).__name__
+
+
+def prompt_key(model, messages):
+    payload = json.dumps({
+        "model": model_name(model),
+        "messages": [[message.type, message.content] for message in messages],
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, collection, ttl_seconds, max_entries):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.collection.create_index("key", unique=True)
+        self.collection.create_index("last_used_at")
+        try:
+            self.collection.create_index("created_at", expireAfterSeconds=ttl_seconds)
+        except OperationFailure:
+            # An existing TTL index with another expiry; reads still enforce ours
+            pass
+
+    def lookup(self, model, messages):
+        """Cached response text for this model and prompt, or None (counted as a miss)."""
+        key = prompt_key(model, messages)
+        now = datetime.datetime.utcnow()
+        doc = self.collection.find_one({"key": key})
+        if doc and (now - doc["created_at"]).total_seconds() < self.ttl_seconds:
+            self.collection.update_one({"_id": doc["_id"]}, {"$set": {"last_used_at": now}, "$inc": {"hits": 1}})
+            self._count(hit=True)
+            return doc["content"]
+        self._count(hit=False)
+        return None
+
+    def store(self, model, messages, content):
+        key = prompt_key(model, messages)
+        now = datetime.datetime.utcnow()
+        self.collection.update_one(
+            {"key": key},
+            {"$set": {
+                "key": key,
+                "model": model_name(model),
+                "content": content,
+                "created_at": now,
+                "last_used_at": now,
+                "hits": 0,
+            }},
+            upsert=True,
+        )
+        self._evict()
+
+    def invoke(self, model, messages, refresh=False):
+        content = None if refresh else self.lookup(model, messages)
+        if content is not None:
+            return AIMessage(content=content)
+        if refresh:
+            self._count(hit=False)
+        response = model.invoke(messages)
+        self.store(model, messages, response.content)
+        return response
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": self.collection.estimated_document_count(),
+            }
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _evict(self):
+        excess = self.collection.estimated_document_count() - self.max_entries
+        if excess > 0:
+            oldest = [doc["_id"] for doc in self.collection.find({}, {"_id": 1}).sort("last_used_at", 1).limit(excess)]
+            self.collection.delete_many({"_id": {"$in": oldest}})
+
+
+@st.cache_resource
+def get_llm_cache(_collection):
+    ttl_hours = float(os.getenv("LLM_CACHE_TTL_HOURS", DEFAULT_TTL_HOURS))
+    max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+    return LLMCache(_collection, int(ttl_hours * 3600), max_entries)
+
+
+def cached_invoke(messages, refresh=False, label="invoke"):
+    # Falls back to a direct call when no cache has been configured for the session
+    model = st.session_state["model"]
+    cache = st.session_state.get("llm_cache")
+    tokens = log_prompt_size(label, messages)
+    with span("llm.invoke", label=label, tokens=tokens) as s:
+        if cache is None:
+            return model.invoke(messages)
+        hits = cache.hits
+        response = cache.invoke(model, messages, refresh=refresh)
+        s.set(cached=cache.hits > hits)
+        return response
@@ -0,0 +1,161 @@
+# ----------------------------
+# File: utils/llm_orchestrator.py
+# ----------------------------
+# Runs independent LLM prompts concurrently and streams their tokens into
+# Streamlit placeholders. Worker threads only talk to the model and the LLM
+# cache; every UI update happens on the script thread, which drains an event
+# queue, so no Streamlit call is made from a background thread.
+import os
+import queue
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from utils.jobs import JobCancelled, wait_for_job
+from utils.prompt_context import log_prompt_size
+from utils.tracing import span
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 4))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 4))
+LLM_BACKOFF_S = float(os.getenv("LLM_BACKOFF_S", 1.0))
+STREAM_CURSOR = "▌"
+# Background jobs publish their text so far at most this often
+PARTIAL_UPDATE_S = 0.5
+MESSAGE_TYPES = {"human": HumanMessage, "ai": AIMessage, "system": SystemMessage}
+
+
+def is_rate_limited(error):
+    text = f"{type(error).__name__} {error}".lower()
+    return "ratelimit" in text or "rate limit" in text or "429" in text
+
+
+def _stream_one(model, cache, key, messages, refresh, events):
+    if cache is not None and not refresh:
+        content = cache.lookup(model, messages)
+        if content is not None:
+            events.put(("done", key, content))
+            return
+
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        parts = []
+        try:
+            for chunk in model.stream(messages):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    events.put(("chunk", key, chunk.content))
+            break
+        except Exception as e:
+            if not is_rate_limited(e) or attempt == LLM_MAX_RETRIES:
+                events.put(("error", key, str(e)))
+                return
+            events.put(("reset", key, None))
+            time.sleep(LLM_BACKOFF_S * 2 ** attempt + random.uniform(0, LLM_BACKOFF_S))
+
+    content = "".join(parts)
+    if cache is not None:
+        cache.store(model, messages, content)
+    events.put(("done", key, content))
+
+
+def _run_guarded(model, cache, key, messages, refresh, events):
+    # Any unexpected failure still has to produce a terminal event, or the drain loop would wait forever
+    try:
+        _stream_one(model, cache, key, messages, refresh, events)
+    except Exception as e:
+        events.put(("error", key, str(e)))
+
+
+def stream_prompts(jobs, placeholders, refresh=False, max_concurrency=LLM_MAX_CONCURRENCY, label="stream"):
+    """Run `jobs` ({key: messages}) concurrently, streaming each into `placeholders[key]`.
+
+    Returns {key: response text}; failed prompts map to None after a warning is shown.
+    """
+    model = st.session_state["model"]
+    cache = st.session_state.get("llm_cache")
+    events = queue.Queue()
+    buffers = {key: "" for key in jobs}
+    results = {}
+    # Spans open at submit and close when the result is drained, all on the script thread
+    spans = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(jobs)))) as pool:
+        for key, messages in jobs.items():
+            tokens = log_prompt_size(f"{label}:{key}", messages)
+            spans[key] = span("llm.stream", label=f"{label}:{key}", tokens=tokens).__enter__()
+            pool.submit(_run_guarded, model, cache, key, messages, refresh, events)
+
+        while len(results) < len(jobs):
+            kind, key, payload = events.get()
+            if kind == "chunk":
+                buffers[key] += payload
+                placeholders[key].markdown(buffers[key] + STREAM_CURSOR)
+            elif kind == "reset":
+                buffers[key] = ""
+                placeholders[key].markdown("⏳ Rate limited, retrying...")
+            elif kind == "done":
+                results[key] = payload
+                placeholders[key].markdown(payload)
+                spans[key].__exit__(None, None, None)
+            else:
+                results[key] = None
+                placeholders[key].warning(f"⚠️ Could not generate response: {payload}")
+                spans[key].set(error=payload).__exit__(None, None, None)
+    return results
+
+
+def messages_to_doc(messages):
+    return [[message.type, message.content] for message in messages]
+
+
+def messages_from_doc(doc):
+    return [MESSAGE_TYPES[kind](content=content) for kind, content in doc]
+
+
+def stream_job(ctx, model, cache, messages, label="job"):
+    """Job handler for one prompt (`messages` as from messages_to_doc); the text so far is the job's partial output."""
+    messages = messages_from_doc(messages)
+    if cache is not None and not ctx.refresh:
+        content = cache.lookup(model, messages)
+        if content is not None:
+            return content
+
+    log_prompt_size(f"job:{label}", messages)
+    ctx.progress(message="waiting for the model")
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        parts = []
+        published = time.monotonic()
+        try:
+            for chunk in model.stream(messages):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    if time.monotonic() - published >= PARTIAL_UPDATE_S:
+                        ctx.progress(message="writing", partial="".join(parts))
+                        published = time.monotonic()
+            break
+        except JobCancelled:
+            raise
+        except Exception as e:
+            if not is_rate_limited(e) or attempt == LLM_MAX_RETRIES:
+                raise
+            ctx.progress(message="rate limited, retrying", partial="")
+            time.sleep(LLM_BACKOFF_S * 2 ** attempt + random.uniform(0, LLM_BACKOFF_S))
+
+    content = "".join(parts)
+    if cache is not None:
+        cache.store(model, messages, content)
+    return content
+
+
+def prompt_job(queue, dataset, messages, label, refresh=False):
+    """Response text of a prompt run as a shared background job; None while it runs (progress is shown) or on failure."""
+    params = {"messages": messages_to_doc(messages), "label": label}
+    job = wait_for_job(queue, queue.submit("llm", dataset, params, refresh=refresh), f"🧠 Generating {label}")
+    if job is None:
+        return None
+    if job["status"] != "done":
+        st.warning(f"⚠️ Could not generate response: {job.get('error') or job['status']}")
+        return None
+    return job["result"]
@@ -0,0 +1,51 @@
+# ----------------------------
+# File: utils/missing_index.py
+# ----------------------------
+# Run-length encoded index of missing values. Each column's null mask is
+# scanned once for contiguous gaps, so the index holds one row per gap rather
+# than one row per dataset cell, and the largest outages sort first.
+import numpy as np
+import pandas as pd
+
+from utils.tracing import traced
+
+MISSING_INDEX_COLUMNS = ["Column", "Start Row", "End Row", "Length", "Start Time", "End Time"]
+
+
+def _runs(mask):
+    # Starts/ends (exclusive) of every run of True in a boolean array
+    padded = np.concatenate(([0], mask.view(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(padded))
+    return edges[0::2], edges[1::2]
+
+
+@traced("pandas.build_missing_index", rows=len)
+def build_missing_index(df, time_col=None):
+    times = pd.to_datetime(df[time_col], errors="coerce").to_numpy() if time_col is not None else None
+    null_masks = df.isnull()
+    parts = []
+    for col in null_masks.columns[null_masks.any().to_numpy()]:
+        starts, ends = _runs(null_masks[col].to_numpy())
+        part = {
+            "Column": np.full(len(starts), str(col), dtype=object),
+            "Start Row": df.index[starts],
+            "End Row": df.index[ends - 1],
+            "Length": ends - starts,
+        }
+        if times is not None:
+            part["Start Time"] = times[starts]
+            part["End Time"] = times[ends - 1]
+        parts.append(pd.DataFrame(part))
+
+    if not parts:
+        return pd.DataFrame(columns=MISSING_INDEX_COLUMNS if time_col is not None else MISSING_INDEX_COLUMNS[:4])
+    index = pd.concat(parts, ignore_index=True)
+    return index.sort_values(["Length", "Column"], ascending=[False, True], kind="mergesort").reset_index(drop=True)
+
+
+def query_missing_index(index, column=None, page=0, page_size=100):
+    """One page of gaps, largest first, optionally restricted to a single column."""
+    if column is not None:
+        index = index[index["Column"] == column]
+    start = page * page_size
+    return index.iloc[start:start + page_size], len(index)
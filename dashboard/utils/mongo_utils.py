@@ -1,15 +1,112 @@
 # File: utils/mongo_utils.py
 # ----------------------------
+import datetime
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 import streamlit as st
 
-def fetch_wamo_df(lake_name, mapping, collection):
+from utils.compact import compact_frame
+from utils.tracing import traced
+
+WAMO_BATCH_SIZE = 10_000
+# Stations fetched at once; each fetch holds one pooled Mongo connection
+WAMO_FETCH_WORKERS = int(os.getenv("WAMO_FETCH_WORKERS", 8))
+
+# (collection, time field) pairs whose compound index has already been ensured
+_indexed = set()
+
+def find_time_field(doc):
+    for key in doc:
+        if "date" in key.lower() or "time" in key.lower():
+            return key
+    return None
+
+def ensure_wamo_index(collection, time_field):
+    token = (collection.full_name, time_field)
+    if token not in _indexed:
+        collection.create_index([("wamo_id", 1), (time_field, 1)])
+        _indexed.add(token)
+
+@traced("mongo.fetch_wamo_df", rows=len, bytes=lambda df: int(df.memory_usage(index=False).sum()))
+def fetch_wamo_df(lake_name, mapping, collection, start=None, end=None, columns=None, batch_size=WAMO_BATCH_SIZE):
     wamo_id = mapping.get(lake_name)
     if not wamo_id:
         st.warning("No WAMO ID mapped for selected lake.")
         return pd.DataFrame()
-    wamo_docs = list(collection.find({"wamo_id": wamo_id}))
-    return pd.DataFrame(wamo_docs)
+
+    # One sample document tells us the timestamp field, its storage type and the raw field names
+    sample = collection.find_one({"wamo_id": wamo_id}, {"_id": 0})
+    if not sample:
+        return pd.DataFrame()
+    time_field = find_time_field(sample)
+
+    query = {"wamo_id": wamo_id}
+    filter_client_side = False
+    if time_field:
+        ensure_wamo_index(collection, time_field)
+        if start is not None or end is not None:
+            if isinstance(sample[time_field], datetime.datetime):
+                window = {}
+                if start is not None:
+                    window["$gte"] = pd.Timestamp(start).to_pydatetime()
+                if end is not None:
+                    window["$lte"] = pd.Timestamp(end).to_pydatetime()
+                query[time_field] = window
+            else:
+                # String timestamps can't be range-filtered reliably in Mongo
+                filter_client_side = True
+
+    projection = {"_id": 0}
+    if columns is not None:
+        wanted = {normalize_name(col) for col in columns}
+        fields = [key for key in sample if normalize_name(key) in wanted or key == time_field]
+        projection.update({key: 1 for key in fields})
+
+    # Build columns directly from cursor batches instead of a list of dicts
+    arrays = {}
+    row_count = 0
+    cursor = collection.find(query, projection, batch_size=batch_size)
+    if time_field:
+        cursor = cursor.sort(time_field, 1)
+    for doc in cursor:
+        for key, value in doc.items():
+            values = arrays.get(key)
+            if values is None:
+                values = arrays[key] = [None] * row_count
+            values.append(value)
+        row_count += 1
+        for values in arrays.values():
+            if len(values) < row_count:
+                values.append(None)
+
+    wamo_df = pd.DataFrame(arrays)
+    if filter_client_side and not wamo_df.empty:
+        times = pd.to_datetime(wamo_df[time_field], errors="coerce")
+        mask = pd.Series(True, index=wamo_df.index)
+        if start is not None:
+            mask &= times >= pd.Timestamp(start)
+        if end is not None:
+            mask &= times <= pd.Timestamp(end)
+        wamo_df = wamo_df[mask].reset_index(drop=True)
+    return compact_frame(wamo_df)
+
+@traced("mongo.fetch_wamo_frames", stations=len)
+def fetch_wamo_frames(lake_names, mapping, collection, start=None, end=None, columns=None, max_workers=WAMO_FETCH_WORKERS):
+    """{lake: sensor frame} for every mapped lake, fetched concurrently; total time tracks the slowest lake."""
+    lakes = [lake for lake in lake_names if mapping.get(lake)]
+    if not lakes:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(lakes)))) as pool:
+        futures = {
+            lake: pool.submit(fetch_wamo_df, lake, mapping, collection, start=start, end=end, columns=columns)
+            for lake in lakes
+        }
+        return {lake: future.result() for lake, future in futures.items()}
+
+def normalize_name(col):
+    return str(col).strip().lower().replace(" ", "_").replace("-", "_")
 
 def normalize_columns(df):
     df.columns = (
@@ -20,16 +117,15 @@ def normalize_columns(df):
     )
     return df
 
-def generate_comparison_prompt(df_manual, df_wamo):
+def generate_comparison_prompt(summary):
+    # The numbers are computed; the model only describes them
     return f"""
-You are a scientific data analyst. Compare manually collected water quality data (CSV) with WAMO sensor data.
-
-Generate a table like:
-| Parameter | Manual Avg | WAMO Avg | Difference | Trend |
+You are a scientific data analyst. Below are per-parameter statistics comparing manually collected
+water quality data (CSV) with WAMO sensor stations over the same period. Averages and differences are in
+the parameter's units; trends are least-squares slopes per day; Difference = Manual Avg − WAMO Avg.
 
-Manual Sample (first 5 rows):
-{df_manual.head(5).to_string(index=False)}
+{summary.to_string(index=False) if not summary.empty else "No shared parameters."}
 
-WAMO Sensor Data (first 5 rows):
-{df_wamo.head(5).to_string(index=False)}
+In a few short paragraphs, point out the largest differences, any stations or parameters whose trends
+disagree, and what might explain them. Quote numbers only from the table; do not add a new table.
 """
@@ -0,0 +1,173 @@
+# ----------------------------
+# File: utils/outliers.py
+# ----------------------------
+# Rolling robust outlier fences for every numeric column at once. Rows are
+# ordered by their parsed timestamp a single time, then a centred,
+# time-windowed median and MAD (a Hampel filter) give each reading its own
+# fences, so seasonal and diurnal swings don't trip a global threshold.
+# Readings are grouped into day-long buckets: the window's median is the
+# median of its buckets' exact medians, and fences are interpolated between
+# bucket centres. That keeps the sweep to a few grouped medians per column,
+# and a whole day per bucket keeps diurnal cycles from biasing the estimate.
+# Fences are stored per bucket with the flagged rows, so a dataset version is
+# computed once and inspecting another parameter is a lookup.
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.tracing import traced
+
+OUTLIER_WINDOW = os.getenv("OUTLIER_WINDOW", "7D")
+# Modified z-score cut-off: |x − median| > threshold × 1.4826 × MAD
+OUTLIER_THRESHOLD = float(os.getenv("OUTLIER_THRESHOLD", 3.5))
+OUTLIER_BUCKET = os.getenv("OUTLIER_BUCKET", "1D")
+OUTLIER_MIN_PERIODS = 8
+MAD_SCALE = 1.4826
+
+
+def outlier_params(time_col, columns):
+    """What a stored set of fences was computed with; stored and looked up as is."""
+    return {"time_col": time_col, "columns": list(columns), "window": OUTLIER_WINDOW, "threshold": OUTLIER_THRESHOLD, "bucket": OUTLIER_BUCKET}
+
+
+def _time_order(df, time_col):
+    # Parsed times, row positions in time order and their int64 nanoseconds
+    times = pd.to_datetime(df[time_col], errors="coerce")
+    ns = times.to_numpy(dtype="datetime64[ns]").view("int64")
+    if times.is_monotonic_increasing and not times.hasnans:
+        # Stored station exports are usually in time order already
+        return times, np.arange(len(ns)), ns
+    valid = times.notna().to_numpy()
+    order = np.flatnonzero(valid)[np.argsort(ns[valid], kind="stable")]
+    return times, order, ns[order]
+
+
+def _rolling_median(per_bucket, span):
+    return per_bucket.rolling(span, center=True, min_periods=1).median().to_numpy().copy()
+
+
+def _interp(ns, centres, per_bucket):
+    if not len(centres):
+        return np.full(len(ns), np.nan)
+    return np.interp(ns, centres, per_bucket)
+
+
+@traced("pandas.outlier_fences", rows=len)
+def outlier_fences(df, time_col, columns, window=OUTLIER_WINDOW, threshold=OUTLIER_THRESHOLD, bucket=OUTLIER_BUCKET, progress=None):
+    """Fences for `columns`: per-bucket median and half-width plus the flagged row positions.
+
+    Rows without a parseable timestamp are left out; missing readings are never flagged.
+    `progress(fraction)` is called after each column.
+    """
+    _, order, ns = _time_order(df, time_col)
+    window_ns = pd.Timedelta(window).value
+    bucket_ns = max(min(pd.Timedelta(bucket).value, window_ns // 3), 1)
+    # Odd, so the window is centred on its bucket
+    span = max(window_ns // bucket_ns, 1) | 1
+    start = int(ns[0]) if len(ns) else 0
+    slots = (ns[-1] - start) // bucket_ns + 1 if len(ns) else 0
+    centres = start + (np.arange(slots) + 0.5) * bucket_ns
+    # Bucket codes as a categorical group every column without re-factorizing, empty buckets included
+    buckets = pd.Categorical.from_codes((ns - start) // bucket_ns, categories=pd.RangeIndex(slots))
+
+    fences = {"time_col": time_col, "window": window, "threshold": threshold, "start_ns": start, "bucket_ns": int(bucket_ns), "columns": {}}
+    for i, col in enumerate(columns):
+        values = df[col].to_numpy(dtype="float64")[order]
+        grouped = pd.Series(values, copy=False).groupby(buckets, observed=False)
+        readings = grouped.count().rolling(span, center=True, min_periods=1).sum().to_numpy()
+        median = _rolling_median(grouped.median(), span)
+        median[readings < OUTLIER_MIN_PERIODS] = np.nan
+        del grouped
+
+        # Row-length temporaries are reused in place; a 1M-row column needs a handful of them
+        deviation = _interp(ns, centres, median)
+        np.subtract(values, deviation, out=deviation)
+        np.abs(deviation, out=deviation)
+        del values
+        spread = pd.Series(deviation, copy=False).groupby(buckets, observed=False).median()
+        width = _rolling_median(spread, span)
+        # A flat stretch has MAD 0; the column's typical spread across all buckets stands in there
+        width = np.where(width > 0, width, spread.median()) * threshold * MAD_SCALE
+        flagged = deviation > _interp(ns, centres, width)
+        del deviation
+        fences["columns"][col] = {
+            "median": median.astype("float32"),
+            "width": width.astype("float32"),
+            "outliers": order[flagged],
+        }
+        if progress is not None:
+            progress((i + 1) / len(columns))
+    return fences
+
+
+def outlier_view(fences, df, time_col, col):
+    """`time_col`, `col`, `lower`, `upper`, `is_outlier` for one column in time order, from stored fences."""
+    times, order, ns = _time_order(df, time_col)
+    spec = fences["columns"][col]
+    centres = fences["start_ns"] + (np.arange(len(spec["median"])) + 0.5) * fences["bucket_ns"]
+    # Fences are built in place and handed to the frame uncopied; a view is rebuilt per inspected column
+    lower = _interp(ns, centres, spec["median"])
+    width = _interp(ns, centres, spec["width"])
+    upper = lower + width
+    lower -= width
+    del width
+    flagged = np.zeros(len(df), dtype=bool)
+    flagged[spec["outliers"]] = True
+    return pd.DataFrame({
+        time_col: times.to_numpy()[order],
+        col: df[col].to_numpy(dtype="float64")[order],
+        "lower": lower,
+        "upper": upper,
+        "is_outlier": flagged[order],
+    }, index=df.index[order], copy=False)
+
+
+def outlier_counts(fences, columns):
+    """Flagged readings per column, for a station-wide QC overview."""
+    return pd.DataFrame({
+        "Column": columns,
+        "Outliers": [len(fences["columns"][col]["outliers"]) for col in columns],
+    })
+
+
+def fences_to_doc(fences):
+    return {
+        **{key: value for key, value in fences.items() if key != "columns"},
+        "columns": [
+            {
+                "name": col,
+                "median": spec["median"].tobytes(),
+                "width": spec["width"].tobytes(),
+                "outliers": spec["outliers"].astype("int64").tobytes(),
+            }
+            for col, spec in fences["columns"].items()
+        ],
+    }
+
+
+def fences_from_doc(doc):
+    fences = {key: value for key, value in doc.items() if key != "columns"}
+    fences["columns"] = {
+        spec["name"]: {
+            "median": np.frombuffer(spec["median"], dtype="float32"),
+            "width": np.frombuffer(spec["width"], dtype="float32"),
+            "outliers": np.frombuffer(spec["outliers"], dtype="int64"),
+        }
+        for spec in doc["columns"]
+    }
+    return fences
+
+
+def load_fences(dataset_key, params, outlier_collection):
+    doc = outlier_collection.find_one({"filename": dataset_key[0], "version": dataset_key[1], "params": params}, {"fences": 1})
+    return fences_from_doc(doc["fences"]) if doc else None
+
+
+def save_fences(dataset_key, params, fences, outlier_collection):
+    # One document per file and parameters; a new dataset version replaces the old one
+    outlier_collection.replace_one(
+        {"filename": dataset_key[0], "params": params},
+        {"filename": dataset_key[0], "version": dataset_key[1], "params": params, "fences": fences_to_doc(fences)},
+        upsert=True,
+    )
@@ -0,0 +1,361 @@
+# ----------------------------
+# File: utils/profile.py
+# ----------------------------
+# Dataset profile computed once per stored dataset version and persisted in
+# `CSVProfiles`. The preview tab and the LLM prompts read column statistics
+# from here instead of recomputing describe()/isnull() on every rerun.
+# Alongside the profile we keep its mergeable state (Welford moments, min/max,
+# quantile sketches, missing counts), so appending rows only has to profile
+# the appended rows.
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from utils.sketch import merge_sketches, sketch_cdf, sketch_from_values, sketch_quantiles
+from utils.tracing import traced
+
+PROFILE_QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+HISTOGRAM_BINS = 30
+MAX_REPORTED_GAPS = 10
+GAP_FACTOR = 3
+# Spacings above this multiple of the median are kept individually so gap counts stay exact
+GAP_CANDIDATE_FACTOR = 2.5
+MAX_GAP_CANDIDATES = 5_000
+LOW_VARIANCE_CV = 1e-3
+
+
+def _float(value):
+    return None if value is None or pd.isna(value) else float(value)
+
+
+def find_time_column(df):
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            return col
+    for col in df.columns:
+        if "date" in str(col).lower() or "time" in str(col).lower():
+            return col
+    return None
+
+
+def _numeric_state(values):
+    mean = values.mean()
+    return {
+        "count": int(values.size),
+        "mean": float(mean),
+        "m2": float(np.square(values - mean).sum()),
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "sketch": sketch_from_values(values),
+    }
+
+
+def _merge_numeric(a, b):
+    # Chan et al.'s pairwise form of Welford's update: exact mean/variance from two partial states
+    if not a or not b:
+        return a or b
+    count = a["count"] + b["count"]
+    delta = b["mean"] - a["mean"]
+    return {
+        "count": count,
+        "mean": a["mean"] + delta * b["count"] / count,
+        "m2": a["m2"] + b["m2"] + delta * delta * a["count"] * b["count"] / count,
+        "min": min(a["min"], b["min"]),
+        "max": max(a["max"], b["max"]),
+        "sketch": merge_sketches(a["sketch"], b["sketch"]),
+    }
+
+
+def _numeric_profile(state):
+    if not state:
+        return None
+    mean, lo, hi = state["mean"], state["min"], state["max"]
+    std = float(np.sqrt(state["m2"] / (state["count"] - 1))) if state["count"] > 1 else 0.0
+    # Same bins as np.histogram; counts read off the sketch's CDF
+    edges = np.linspace(lo, hi, HISTOGRAM_BINS + 1) if hi > lo else np.linspace(lo - 0.5, hi + 0.5, HISTOGRAM_BINS + 1)
+    cumulative = np.round(sketch_cdf(state["sketch"], edges, lo, hi) * state["count"])
+    cumulative[0], cumulative[-1] = 0, state["count"]
+    quantiles = sketch_quantiles(state["sketch"], PROFILE_QUANTILES, lo, hi)
+    return {
+        "mean": float(mean),
+        "std": std,
+        "min": float(lo),
+        "max": float(hi),
+        "quantiles": {str(q): float(v) for q, v in zip(PROFILE_QUANTILES, quantiles)},
+        "histogram": {"edges": edges.tolist(), "counts": np.diff(cumulative).astype(int).tolist()},
+        "low_variance": bool(std == 0 or (mean != 0 and abs(std / mean) < LOW_VARIANCE_CV)),
+    }
+
+
+def time_ns(series):
+    """Timestamps as int64 nanoseconds plus a validity mask (unparseable values are invalid)."""
+    times = pd.to_datetime(series, errors="coerce")
+    return times.to_numpy(dtype="datetime64[ns]").view("int64"), times.notna().to_numpy()
+
+
+def _median(spacing):
+    return float(sketch_quantiles(spacing["sketch"], [0.5], spacing["min"], spacing["max"])[0])
+
+
+def _gap_candidates(gaps, spacing, complete):
+    limit = GAP_CANDIDATE_FACTOR * max(_median(spacing), 1.0)
+    gaps = sorted((gap for gap in gaps if gap[2] > limit), key=lambda gap: gap[2], reverse=True)
+    return gaps[:MAX_GAP_CANDIDATES], complete and len(gaps) <= MAX_GAP_CANDIDATES
+
+
+def time_state(series, time_col):
+    ns, valid = time_ns(series)
+    times = np.sort(ns[valid])
+    if times.size == 0:
+        return None
+    spacing = np.diff(times) / 1e9
+    state = {
+        "column": str(time_col),
+        "start": int(times[0]),
+        "end": int(times[-1]),
+        "spacing": _numeric_state(spacing) if spacing.size else None,
+        "gaps": [],
+        "gaps_complete": True,
+    }
+    if spacing.size:
+        wide = np.flatnonzero(spacing > GAP_CANDIDATE_FACTOR * max(float(np.median(spacing)), 1.0))
+        gaps = [[int(times[i]), int(times[i + 1]), float(spacing[i])] for i in wide]
+        state["gaps"], state["gaps_complete"] = _gap_candidates(gaps, state["spacing"], True)
+    return state
+
+
+def _merge_time(a, b):
+    """Merged time state, or None when the two ranges interleave (spacing then needs a rescan)."""
+    if not a or not b:
+        return a or b
+    if b["start"] >= a["end"]:
+        first, second = a, b
+    elif a["start"] >= b["end"]:
+        first, second = b, a
+    else:
+        return None
+    boundary = (second["start"] - first["end"]) / 1e9
+    spacing = _merge_numeric(first["spacing"], _numeric_state(np.array([boundary])))
+    spacing = _merge_numeric(spacing, second["spacing"])
+    gaps, complete = _gap_candidates(
+        first["gaps"] + [[first["end"], second["start"], boundary]] + second["gaps"],
+        spacing,
+        first["gaps_complete"] and second["gaps_complete"],
+    )
+    return {
+        "column": first["column"],
+        "start": first["start"],
+        "end": second["end"],
+        "spacing": spacing,
+        "gaps": gaps,
+        "gaps_complete": complete,
+    }
+
+
+def _time_profile(state):
+    spacing = state["spacing"] if state else None
+    if not spacing:
+        return None
+    median_spacing = _median(spacing)
+    threshold = GAP_FACTOR * max(median_spacing, 1.0)
+    gaps = [gap for gap in state["gaps"] if gap[2] > threshold]
+    if state["gaps_complete"]:
+        gap_count = len(gaps)
+    else:
+        gap_count = round(spacing["count"] * (1 - sketch_cdf(spacing["sketch"], threshold, spacing["min"], spacing["max"])))
+    spacing_std = np.sqrt(spacing["m2"] / (spacing["count"] - 1)) if spacing["count"] > 1 else np.nan
+    to_datetime = lambda ns: pd.Timestamp(ns).floor("us").to_pydatetime()
+    return {
+        "column": state["column"],
+        "start": to_datetime(state["start"]),
+        "end": to_datetime(state["end"]),
+        "median_spacing_s": median_spacing,
+        "gap_count": int(gap_count),
+        # NaN (a single spacing) compares False, as pandas' std did
+        "evenly_spaced": bool(spacing_std <= 0.01 * max(median_spacing, 1.0)),
+        "largest_gaps": [
+            {"start": to_datetime(start), "end": to_datetime(end), "duration_s": float(duration)}
+            for start, end, duration in gaps[:MAX_REPORTED_GAPS]
+        ],
+    }
+
+
+@traced("pandas.profile_state", rows=lambda state: state["row_count"])
+def profile_state(df):
+    """Mergeable statistics for `df`: counts, missingness, Welford moments, min/max, quantile sketches."""
+    columns = []
+    null_counts = df.isnull().sum()
+    for col in df.columns:
+        entry = {
+            "name": str(col),
+            "dtype": str(df[col].dtype),
+            "count": int(len(df) - null_counts[col]),
+            "null_count": int(null_counts[col]),
+        }
+        if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col]):
+            values = df[col].dropna().to_numpy(dtype="float64")
+            entry["numeric"] = _numeric_state(values) if values.size else None
+        columns.append(entry)
+
+    time_col = find_time_column(df)
+    return {
+        "row_count": int(len(df)),
+        "columns": columns,
+        "time": time_state(df[time_col], time_col) if time_col is not None else None,
+    }
+
+
+def _merge_dtype(a, b):
+    if a is None or a == b:
+        return b
+    if b is None:
+        return a
+    try:
+        return str(np.result_type(a, b))
+    except TypeError:
+        return b
+
+
+def merge_states(a, b):
+    """State of the rows of `a` followed by those of `b`, without revisiting either.
+
+    When the two time ranges interleave the result has `time_stale` set and its
+    time section must be rebuilt with `with_time_state` from the full time column.
+    """
+    if a is None:
+        return b
+    a_columns = {c["name"]: c for c in a["columns"]}
+    b_columns = {c["name"]: c for c in b["columns"]}
+    names = list(a_columns) + [name for name in b_columns if name not in a_columns]
+    columns = []
+    for name in names:
+        # A column missing on one side counts as entirely missing there
+        x = a_columns.get(name, {"dtype": None, "count": 0, "null_count": a["row_count"]})
+        y = b_columns.get(name, {"dtype": None, "count": 0, "null_count": b["row_count"]})
+        entry = {
+            "name": name,
+            "dtype": _merge_dtype(x["dtype"], y["dtype"]),
+            "count": x["count"] + y["count"],
+            "null_count": x["null_count"] + y["null_count"],
+        }
+        if "numeric" in x or "numeric" in y:
+            entry["numeric"] = _merge_numeric(x.get("numeric"), y.get("numeric"))
+        columns.append(entry)
+
+    merged = {"row_count": a["row_count"] + b["row_count"], "columns": columns}
+    same_column = not a["time"] or not b["time"] or a["time"]["column"] == b["time"]["column"]
+    merged["time"] = _merge_time(a["time"], b["time"]) if same_column else a["time"]
+    if a.get("time_stale") or b.get("time_stale") or (a["time"] and b["time"] and merged["time"] is None):
+        merged["time_stale"] = True
+    return merged
+
+
+def with_time_state(state, series, time_col):
+    state = {key: value for key, value in state.items() if key != "time_stale"}
+    state["time"] = time_state(series, time_col)
+    return state
+
+
+def finalize_profile(state):
+    """Profile document (the shape the tabs read) from a statistics state."""
+    row_count = state["row_count"]
+    columns = []
+    for c in state["columns"]:
+        entry = {
+            "name": c["name"],
+            "dtype": c["dtype"],
+            "count": c["count"],
+            "null_count": c["null_count"],
+            "null_pct": float(c["null_count"] / row_count * 100) if row_count else 0.0,
+        }
+        if "numeric" in c:
+            entry["numeric"] = _numeric_profile(c["numeric"])
+        columns.append(entry)
+    return {
+        "row_count": row_count,
+        "column_count": len(columns),
+        "columns": columns,
+        "time": _time_profile(state["time"]),
+        "computed_at": datetime.datetime.utcnow(),
+    }
+
+
+@traced("pandas.compute_profile")
+def compute_profile(df):
+    return finalize_profile(profile_state(df))
+
+
+def load_profile_state(upload_id, version, profile_collection):
+    doc = profile_collection.find_one({"upload_id": upload_id, "version": version}, {"state": 1})
+    return doc.get("state") if doc else None
+
+
+def save_profile(meta, version, state, profile_collection):
+    profile = finalize_profile(state)
+    profile_collection.replace_one(
+        {"upload_id": meta["_id"]},
+        {"upload_id": meta["_id"], "filename": meta["filename"], "version": version, "profile": profile, "state": state},
+        upsert=True,
+    )
+    return profile
+
+
+def load_stored_profile(upload_id, version, profile_collection):
+    doc = profile_collection.find_one({"upload_id": upload_id, "version": version}, {"profile": 1})
+    return doc["profile"] if doc else None
+
+
+def get_or_compute_profile(meta, version, df, profile_collection):
+    """Stored profile for this dataset version, computing and persisting it on first view."""
+    profile = load_stored_profile(meta["_id"], version, profile_collection)
+    if profile is not None:
+        return profile
+    return save_profile(meta, version, profile_state(df), profile_collection)
+
+
+def missing_table(profile):
+    return pd.DataFrame(
+        [(c["name"], c["null_count"]) for c in profile["columns"]],
+        columns=["Column", "Missing Count"],
+    )
+
+
+def numeric_summary_table(profile):
+    rows = [
+        {
+            "Column": c["name"],
+            "mean": c["numeric"]["mean"],
+            "std": c["numeric"]["std"],
+            "min": c["numeric"]["min"],
+            "max": c["numeric"]["max"],
+            "% Missing": c["null_pct"],
+        }
+        for c in profile["columns"] if c.get("numeric")
+    ]
+    return pd.DataFrame(rows, columns=["Column", "mean", "std", "min", "max", "% Missing"])
+
+
+def profile_prompt_sections(profile):
+    """Missing-value and numeric-stat text blocks for LLM prompts."""
+    missing = pd.Series({c["name"]: round(c["null_pct"], 1) for c in profile["columns"]}).to_string()
+    stats = numeric_summary_table(profile).drop(columns="% Missing").set_index("Column").round(3).to_string()
+    flat = [c["name"] for c in profile["columns"] if c.get("numeric") and c["numeric"]["low_variance"]]
+    time = profile.get("time")
+    if time:
+        timing = (
+            f"Time column `{time['column']}` from {time['start']} to {time['end']}, "
+            f"median spacing {time['median_spacing_s']:.0f}s, {time['gap_count']} gaps "
+            f"(> {GAP_FACTOR}× median spacing), evenly spaced: {time['evenly_spaced']}"
+        )
+        if time["largest_gaps"]:
+            largest = time["largest_gaps"][0]
+            timing += f"; largest gap {largest['duration_s'] / 3600:.1f}h starting {largest['start']}"
+    else:
+        timing = "No time column detected."
+    return {
+        "missing": missing,
+        "stats": stats,
+        "low_variance": ", ".join(flat) if flat else "none",
+        "timing": timing,
+    }
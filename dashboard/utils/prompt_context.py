@@ -0,0 +1,142 @@
+# ----------------------------
+# File: utils/prompt_context.py
+# ----------------------------
+# Compact, token-budgeted description of a dataset for LLM prompts. Instead of
+# pasting raw rows, the digest carries schema, per-column statistics, time
+# coverage, period aggregates and a few evenly spaced sample rows, trimmed in
+# that priority order until it fits the budget.
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.tracing import traced
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 1500))
+DIGEST_SECTIONS = ("schema", "stats", "time", "aggregates", "sample")
+# Share of the budget each section may use; whatever a section leaves unused rolls over to the next
+SECTION_WEIGHTS = {"schema": 0.15, "stats": 0.35, "time": 0.05, "aggregates": 0.25, "sample": 0.2}
+SAMPLE_ROWS = 12
+MAX_PERIODS = 12
+CHARS_PER_TOKEN = 4
+
+logger = logging.getLogger("dashboard.prompts")
+
+
+def estimate_tokens(text):
+    # Close enough for Llama-family tokenizers on English + numbers, and free to compute
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def log_prompt_size(label, messages):
+    tokens = sum(estimate_tokens(str(message.content)) for message in messages)
+    logger.info(json.dumps({"event": "llm_prompt", "label": str(label), "messages": len(messages), "tokens": tokens}))
+    return tokens
+
+
+def _fmt(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return "NA"
+    if isinstance(value, (float, np.floating)):
+        return f"{value:.4g}"
+    return str(value)
+
+
+def _time_column(df, profile):
+    if profile and profile.get("time"):
+        return profile["time"]["column"]
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            return col
+    for col in df.columns:
+        if "date" in str(col).lower() or "time" in str(col).lower():
+            return col
+    return None
+
+
+def _schema_lines(df):
+    columns = [f"{col} ({df[col].dtype})" for col in df.columns]
+    return [f"Schema ({len(df)} rows × {df.shape[1]} columns): " + ", ".join(columns)]
+
+
+def _stats_lines(df, profile):
+    lines = ["Column statistics (full dataset):", "column | mean | std | min | max | % missing"]
+    if profile:
+        for c in profile["columns"]:
+            if c.get("numeric"):
+                n = c["numeric"]
+                lines.append(f"{c['name']} | {_fmt(n['mean'])} | {_fmt(n['std'])} | {_fmt(n['min'])} | {_fmt(n['max'])} | {c['null_pct']:.1f}")
+        return lines
+    numeric = df.select_dtypes(include="number")
+    if numeric.empty:
+        return []
+    stats = numeric.agg(["mean", "std", "min", "max"]).T
+    missing = numeric.isnull().mean() * 100
+    for col, row in stats.iterrows():
+        lines.append(f"{col} | {_fmt(row['mean'])} | {_fmt(row['std'])} | {_fmt(row['min'])} | {_fmt(row['max'])} | {missing[col]:.1f}")
+    return lines
+
+
+def _time_lines(times):
+    valid = times.dropna()
+    if len(valid) < 2:
+        return []
+    spacing = valid.sort_values().diff().dropna().dt.total_seconds()
+    return [f"Time coverage: {valid.min()} → {valid.max()}, median spacing {spacing.median():.0f}s, "
+            f"largest gap {spacing.max() / 3600:.1f}h"]
+
+
+def _aggregate_lines(df, times):
+    numeric_cols = df.select_dtypes(include="number").columns.tolist()
+    valid = times.dropna()
+    if not numeric_cols or len(valid) < 2:
+        return []
+    span_days = (valid.max() - valid.min()).total_seconds() / 86400
+    freq = next((f for f, days in (("D", 1), ("W", 7), ("M", 31), ("Q", 92)) if span_days / days <= MAX_PERIODS), "Y")
+    means = df[numeric_cols].groupby(times.dt.to_period(freq)).mean()
+    lines = [f"Period means ({freq}):", "period | " + " | ".join(map(str, numeric_cols))]
+    lines += [f"{period} | " + " | ".join(_fmt(v) for v in row) for period, row in means.iterrows()]
+    return lines
+
+
+def _sample_lines(df, rows):
+    if df.empty:
+        return []
+    positions = np.unique(np.linspace(0, len(df) - 1, min(rows, len(df))).astype(int))
+    sample = df.iloc[positions].to_string(index=False).splitlines()
+    return [f"Evenly spaced sample ({len(positions)} rows across the dataset):"] + sample
+
+
+@traced("pandas.build_digest", tokens=lambda text: estimate_tokens(text))
+def build_digest(df, profile=None, token_budget=PROMPT_TOKEN_BUDGET, sections=DIGEST_SECTIONS, sample_rows=SAMPLE_ROWS):
+    """Dataset digest for prompts, never longer than `token_budget` (estimated) tokens."""
+    time_col = _time_column(df, profile)
+    times = pd.to_datetime(df[time_col], errors="coerce") if time_col is not None else pd.Series(dtype="datetime64[ns]")
+
+    builders = {
+        "schema": lambda: _schema_lines(df),
+        "stats": lambda: _stats_lines(df, profile),
+        "time": lambda: _time_lines(times),
+        "aggregates": lambda: _aggregate_lines(df, times),
+        "sample": lambda: _sample_lines(df, sample_rows),
+    }
+
+    total_weight = sum(SECTION_WEIGHTS[name] for name in sections)
+    carry = 0
+    parts = []
+    for name in sections:
+        allowance = token_budget * SECTION_WEIGHTS[name] / total_weight + carry
+        kept = []
+        for line in builders[name]():
+            cost = estimate_tokens(line + "\n")
+            if cost > allowance:
+                break
+            kept.append(line)
+            allowance -= cost
+        carry = allowance
+        # A header alone says nothing; single-line sections (schema, time) stand on their own
+        if len(kept) > 1 or (kept and name in ("schema", "time")):
+            parts.append("\n".join(kept))
+    return "\n\n".join(parts)
@@ -0,0 +1,133 @@
+# ----------------------------
+# File: utils/query_engine.py
+# ----------------------------
+# Aggregation queries for the chat assistant, pushed down to DuckDB over an
+# on-disk Parquet copy of each upload. The stored chunks already are Parquet,
+# so the copy is just their bytes written out once per dataset version; a
+# query scans only the columns it touches and returns a small result table.
+import glob
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+import pyarrow.parquet as pq
+
+from utils.storage import STORAGE_FORMAT, read_dataset, to_arrow_table
+from utils.tracing import traced
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+QUERY_DIR = os.getenv("QUERY_ENGINE_DIR", os.path.join(tempfile.gettempdir(), "dashboard-parquet"))
+QUERY_MAX_ROWS = int(os.getenv("QUERY_MAX_ROWS", 200))
+QUERY_TIMEOUT_S = float(os.getenv("QUERY_TIMEOUT_S", 10))
+QUERY_MEMORY_LIMIT = os.getenv("QUERY_MEMORY_LIMIT", "1GB")
+QUERY_THREADS = int(os.getenv("QUERY_THREADS", 4))
+TABLE_NAME = "df"
+
+
+class QueryError(Exception):
+    pass
+
+
+def is_available():
+    return duckdb is not None
+
+
+def _digest(value):
+    return hashlib.sha1(str(value).encode("utf-8")).hexdigest()[:16]
+
+
+def dataset_parquet_dir(meta, upload_collection, chunk_collection, dataset_key):
+    """Directory of Parquet parts for this dataset version, written on first use."""
+    prefix = os.path.join(QUERY_DIR, f"{_digest(dataset_key[0])}-")
+    path = f"{prefix}{_digest(dataset_key[1])}"
+    if os.path.isdir(path):
+        return path
+
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    os.makedirs(tmp_path, exist_ok=True)
+    if meta.get("storage") == STORAGE_FORMAT:
+        # Chunks past num_chunks belong to an append that hasn't been committed yet
+        query = {"upload_id": meta["_id"], "chunk_index": {"$lt": meta["num_chunks"]}}
+        cursor = chunk_collection.find(query, {"data": 1, "chunk_index": 1}).sort("chunk_index", 1)
+        for chunk in cursor:
+            with open(os.path.join(tmp_path, f"part-{chunk['chunk_index']:05d}.parquet"), "wb") as f:
+                f.write(chunk["data"])
+    else:
+        df = read_dataset(meta["filename"], upload_collection, chunk_collection, meta=meta)
+        pq.write_table(to_arrow_table(df), os.path.join(tmp_path, "part-00000.parquet"))
+
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Another session materialized the same version first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    for stale in glob.glob(f"{prefix}*"):
+        if stale != path and not stale.endswith(".tmp"):
+            shutil.rmtree(stale, ignore_errors=True)
+    return path
+
+
+def validate_sql(sql):
+    sql = sql.strip().rstrip(";").strip()
+    if not sql:
+        raise QueryError("The query is empty.")
+    if ";" in sql:
+        raise QueryError("Only a single statement is allowed.")
+    if not re.match(r"(?is)^\s*(select|with)\b", sql):
+        raise QueryError("Only SELECT queries are allowed.")
+    return sql
+
+
+def _literal(text):
+    return "'" + text.replace("'", "''") + "'"
+
+
+def _connect(path):
+    conn = duckdb.connect()
+    conn.execute(f"SET threads = {QUERY_THREADS}")
+    conn.execute(f"SET memory_limit = '{QUERY_MEMORY_LIMIT}'")
+    # Queries may read this dataset's files and nothing else
+    conn.execute(f"SET allowed_directories = [{_literal(path)}]")
+    conn.execute("SET enable_external_access = false")
+    conn.execute("SET lock_configuration = true")
+    conn.execute(
+        f"CREATE VIEW {TABLE_NAME} AS SELECT * FROM read_parquet({_literal(os.path.join(path, '*.parquet'))}, union_by_name = true)"
+    )
+    return conn
+
+
+@traced("duckdb.run_query", rows=lambda result: len(result[0]))
+def run_query(sql, path, max_rows=QUERY_MAX_ROWS, timeout=QUERY_TIMEOUT_S):
+    """Run a read-only query against table `df`; returns `(result_df, truncated)`."""
+    if duckdb is None:
+        raise QueryError("DuckDB is not installed.")
+    sql = validate_sql(sql)
+    conn = _connect(path)
+    timer = threading.Timer(timeout, conn.interrupt)
+    timer.start()
+    try:
+        result = conn.execute(f"SELECT * FROM ({sql}) AS q LIMIT {max_rows + 1}").df()
+    except duckdb.InterruptException:
+        raise QueryError(f"The query took longer than {timeout:.0f}s and was stopped.")
+    except duckdb.Error as e:
+        raise QueryError(str(e).splitlines()[0])
+    finally:
+        timer.cancel()
+        conn.close()
+    return result.head(max_rows), len(result) > max_rows
+
+
+def describe_table(path):
+    """`name TYPE` lines for the prompt, as DuckDB sees the columns."""
+    conn = _connect(path)
+    try:
+        return "\n".join(f'"{name}" {dtype}' for name, dtype, *_ in conn.execute(f"DESCRIBE {TABLE_NAME}").fetchall())
+    finally:
+        conn.close()
@@ -0,0 +1,133 @@
+# ----------------------------
+# File: utils/resources.py
+# ----------------------------
+# Process-wide clients shared by every session on the server: one pooled
+# MongoClient and one chat model. Streamlit re-executes app.py on every
+# interaction, so anything built at module level there would be rebuilt (and
+# reconnect) per rerun; st.cache_resource builds these once per process.
+import os
+import threading
+import time
+
+import streamlit as st
+from pymongo import MongoClient
+from pymongo import monitoring
+from langchain_groq import ChatGroq
+
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 20))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", 5000))
+HEALTH_TTL_S = 30
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama3-70b-8192")
+
+
+class MongoMetrics(monitoring.ConnectionPoolListener, monitoring.CommandListener):
+    """Connection pool and command counters, fed by pymongo's monitoring events."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {
+            "connections_open": 0,
+            "connections_created": 0,
+            "checked_out": 0,
+            "checkout_failures": 0,
+            "pool_clears": 0,
+            "commands": 0,
+            "command_failures": 0,
+        }
+        self.command_seconds = 0.0
+
+    def _add(self, name, value=1):
+        with self._lock:
+            self.counts[name] += value
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = dict(self.counts)
+            snapshot["avg_command_ms"] = 1000 * self.command_seconds / snapshot["commands"] if snapshot["commands"] else 0.0
+            return snapshot
+
+    # Connection pool events
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._add("pool_clears")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add("connections_created")
+        self._add("connections_open")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add("connections_open", -1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._add("checkout_failures")
+
+    def connection_checked_out(self, event):
+        self._add("checked_out")
+
+    def connection_checked_in(self, event):
+        self._add("checked_out", -1)
+
+    # Command events
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        with self._lock:
+            self.counts["commands"] += 1
+            self.command_seconds += event.duration_micros / 1e6
+
+    def failed(self, event):
+        with self._lock:
+            self.counts["commands"] += 1
+            self.counts["command_failures"] += 1
+            self.command_seconds += event.duration_micros / 1e6
+
+
+@st.cache_resource
+def get_mongo_metrics():
+    return MongoMetrics()
+
+
+@st.cache_resource
+def get_mongo_client():
+    return MongoClient(
+        st.secrets["MONGO_URI"],
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        serverSelectionTimeoutMS=MONGO_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_TIMEOUT_MS,
+        appname="wamo-dashboard",
+        event_listeners=[get_mongo_metrics()],
+    )
+
+
+@st.cache_resource
+def get_llm_client():
+    # ChatGroq holds its own HTTP connection pool and is safe to share between sessions
+    return ChatGroq(api_key=st.secrets["GROQ_API_KEY"], model=GROQ_MODEL)
+
+
+@st.cache_data(ttl=HEALTH_TTL_S, show_spinner=False)
+def mongo_health(_client):
+    """Ping result and round-trip latency, refreshed at most every HEALTH_TTL_S seconds."""
+    started = time.perf_counter()
+    try:
+        _client.admin.command("ping")
+        return {"ok": True, "latency_ms": (time.perf_counter() - started) * 1000, "error": None}
+    except Exception as e:
+        return {"ok": False, "latency_ms": None, "error": str(e)}
@@ -0,0 +1,58 @@
+# ----------------------------
+# File: utils/sketch.py
+# ----------------------------
+# Mergeable quantile sketch (a merging t-digest) for incrementally maintained
+# profiles. A sketch is a plain dict of centroid means and weights, so it is
+# stored as-is in the profile document; merging two sketches gives one of the
+# same bounded size, which lets an appended chunk update quantiles without
+# rereading the rows stored before it.
+import numpy as np
+
+SKETCH_COMPRESSION = 200
+
+
+def _compress(means, weights, compression):
+    # `means` sorted ascending. The k1 scale keeps centroids small in the tails
+    # (where quantiles move fastest) and lets them grow around the median.
+    total = weights.sum()
+    mid = (np.cumsum(weights) - weights / 2) / total
+    k = compression / (2 * np.pi) * np.arcsin(2 * mid - 1)
+    buckets = np.floor(k - k[0]).astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    merged_weights = np.add.reduceat(weights, starts)
+    merged_means = np.add.reduceat(means * weights, starts) / merged_weights
+    return {"means": merged_means.tolist(), "weights": merged_weights.tolist()}
+
+
+def sketch_from_values(values, compression=SKETCH_COMPRESSION):
+    values = np.sort(np.asarray(values, dtype="float64"))
+    if values.size == 0:
+        return {"means": [], "weights": []}
+    return _compress(values, np.ones_like(values), compression)
+
+
+def merge_sketches(a, b, compression=SKETCH_COMPRESSION):
+    means = np.asarray(a["means"] + b["means"], dtype="float64")
+    if means.size == 0:
+        return {"means": [], "weights": []}
+    weights = np.asarray(a["weights"] + b["weights"], dtype="float64")
+    order = np.argsort(means, kind="stable")
+    return _compress(means[order], weights[order], compression)
+
+
+def _support(sketch, lo, hi):
+    # Piecewise-linear CDF through the centroid centres, pinned to the exact min/max
+    weights = np.asarray(sketch["weights"], dtype="float64")
+    centres = np.cumsum(weights) - weights / 2
+    return np.r_[0.0, centres, weights.sum()], np.r_[lo, sketch["means"], hi]
+
+
+def sketch_quantiles(sketch, quantiles, lo, hi):
+    positions, values = _support(sketch, lo, hi)
+    return np.interp(np.asarray(quantiles, dtype="float64") * positions[-1], positions, values)
+
+
+def sketch_cdf(sketch, points, lo, hi):
+    """Approximate fraction of values <= each of `points`."""
+    positions, values = _support(sketch, lo, hi)
+    return np.interp(points, values, positions) / positions[-1]
@@ -0,0 +1,182 @@
+# ----------------------------
+# File: utils/storage.py
+# ----------------------------
+# Uploads are stored as a small metadata document in `CSVUploads` plus a
+# series of Parquet-encoded row chunks in `CSVUploadChunks`. Each chunk stays
+# well under the 16 MB BSON limit, and reads only decode the chunks and
+# columns that were asked for. Chunks also record the range of their time
+# column, so appends only revisit the chunks a new file overlaps.
+import datetime
+import io
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from bson.binary import Binary
+
+from utils.tracing import traced
+
+STORAGE_FORMAT = "parquet"
+PARQUET_COMPRESSION = "zstd"
+TARGET_CHUNK_BYTES = 8 * 1024 * 1024
+MIN_CHUNK_ROWS = 1_000
+
+
+def ensure_storage_indexes(upload_collection, chunk_collection):
+    upload_collection.create_index("filename")
+    upload_collection.create_index("content_hash")
+    chunk_collection.create_index([("upload_id", 1), ("chunk_index", 1)], unique=True)
+    chunk_collection.create_index([("upload_id", 1), ("row_start", 1)])
+    chunk_collection.create_index([("upload_id", 1), ("time_min", 1)])
+
+
+def estimate_chunk_rows(df, target_bytes=TARGET_CHUNK_BYTES):
+    # Size chunks from a sample so wide tables get fewer rows per chunk
+    if df.empty:
+        return MIN_CHUNK_ROWS
+    sample = df.head(1_000)
+    bytes_per_row = max(1, int(sample.memory_usage(deep=True, index=False).sum() / len(sample)))
+    return max(MIN_CHUNK_ROWS, target_bytes // bytes_per_row)
+
+
+def to_arrow_table(df):
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed-type object columns (common in Excel exports) can't be typed by Arrow
+        df = df.copy()
+        for col in df.select_dtypes(include="object").columns:
+            df[col] = df[col].map(lambda v: v if v is None or pd.isna(v) else str(v))
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def encode_chunk(df):
+    buffer = io.BytesIO()
+    pq.write_table(to_arrow_table(df), buffer, compression=PARQUET_COMPRESSION)
+    return buffer.getvalue()
+
+
+def decode_chunk(blob, columns=None):
+    return pq.read_table(io.BytesIO(blob), columns=columns).to_pandas()
+
+
+def begin_dataset(filename, upload_collection, columns=None, extra=None):
+    meta = {
+        "filename": filename,
+        "uploaded_at": datetime.datetime.utcnow(),
+        "storage": STORAGE_FORMAT,
+        "status": "writing",
+        "columns": list(columns) if columns is not None else [],
+        "row_count": 0,
+        "num_chunks": 0,
+    }
+    if extra:
+        meta.update(extra)
+    return upload_collection.insert_one(meta).inserted_id
+
+
+def time_bounds(series):
+    """`{time_min, time_max}` in epoch nanoseconds; an empty range when nothing parses."""
+    times = pd.to_datetime(series, errors="coerce").dropna()
+    if times.empty:
+        return {"time_min": int(np.iinfo(np.int64).max), "time_max": int(np.iinfo(np.int64).min)}
+    return {"time_min": int(times.min().value), "time_max": int(times.max().value)}
+
+
+def write_chunk(upload_id, chunk_index, row_start, chunk_df, chunk_collection, time_column=None):
+    doc = {
+        "upload_id": upload_id,
+        "chunk_index": chunk_index,
+        "row_start": row_start,
+        "row_end": row_start + len(chunk_df),
+        "data": Binary(encode_chunk(chunk_df)),
+    }
+    if time_column is not None and time_column in chunk_df.columns:
+        doc.update(time_bounds(chunk_df[time_column]))
+    chunk_collection.insert_one(doc)
+    return len(chunk_df)
+
+
+def finish_dataset(upload_id, upload_collection, row_count, num_chunks, columns, dtypes, extra=None):
+    update = {
+        "status": "ready",
+        "updated_at": datetime.datetime.utcnow(),
+        "row_count": int(row_count),
+        "num_chunks": int(num_chunks),
+        "columns": list(columns),
+        "dtypes": {str(col): str(dtype) for col, dtype in dtypes.items()},
+    }
+    if extra:
+        update.update(extra)
+    upload_collection.update_one({"_id": upload_id}, {"$set": update})
+
+
+def write_dataset(df, filename, upload_collection, chunk_collection, chunk_rows=None):
+    chunk_rows = chunk_rows or estimate_chunk_rows(df)
+    upload_id = begin_dataset(filename, upload_collection, columns=df.columns)
+    num_chunks = 0
+    for num_chunks, row_start in enumerate(range(0, len(df), chunk_rows), start=1):
+        write_chunk(upload_id, num_chunks - 1, row_start, df.iloc[row_start:row_start + chunk_rows], chunk_collection)
+    finish_dataset(upload_id, upload_collection, len(df), num_chunks, df.columns, df.dtypes)
+    return upload_id
+
+
+def delete_dataset(upload_id, upload_collection, chunk_collection):
+    chunk_collection.delete_many({"upload_id": upload_id})
+    upload_collection.delete_one({"_id": upload_id})
+
+
+def get_dataset_meta(filename, upload_collection):
+    # Never pull the legacy inline `data` array just to read metadata
+    return upload_collection.find_one(
+        {"filename": filename, "status": {"$ne": "writing"}}, {"data": 0}, sort=[("uploaded_at", -1)]
+    )
+
+
+def dataset_version(meta):
+    # Changes whenever the stored rows change (re-upload or later writes)
+    stamp = meta.get("updated_at") or meta.get("uploaded_at")
+    return f"{meta['_id']}:{stamp.isoformat() if stamp else ''}"
+
+
+@traced("mongo.read_dataset", rows=len, bytes=lambda df: int(df.memory_usage(index=False).sum()))
+def read_dataset(filename, upload_collection, chunk_collection, columns=None, rows=None, meta=None):
+    """Load a stored upload, optionally restricted to `columns` and a `(start, stop)` row range."""
+    meta = meta or get_dataset_meta(filename, upload_collection)
+    if not meta:
+        return None
+
+    if meta.get("storage") != STORAGE_FORMAT:
+        return _read_legacy_dataset(meta["_id"], upload_collection, columns, rows)
+
+    if columns is not None:
+        wanted = set(columns)
+        columns = [col for col in meta["columns"] if col in wanted]
+
+    start, stop = rows if rows else (0, meta["row_count"])
+    query = {"upload_id": meta["_id"], "row_start": {"$lt": stop}, "row_end": {"$gt": start}}
+    frames = []
+    for chunk in chunk_collection.find(query, {"data": 1, "row_start": 1}).sort("chunk_index", 1):
+        part = decode_chunk(chunk["data"], columns)
+        lo = max(start - chunk["row_start"], 0)
+        hi = stop - chunk["row_start"]
+        frames.append(part.iloc[lo:hi])
+
+    if not frames:
+        empty_cols = columns if columns is not None else meta["columns"]
+        return pd.DataFrame(columns=empty_cols)
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0].reset_index(drop=True)
+    df.index = pd.RangeIndex(start, start + len(df))
+    return df
+
+
+def _read_legacy_dataset(upload_id, upload_collection, columns, rows):
+    doc = upload_collection.find_one({"_id": upload_id}, {"data": 1})
+    df = pd.DataFrame(doc.get("data", []))
+    if rows:
+        df = df.iloc[rows[0]:rows[1]]
+    if columns is not None:
+        wanted = set(columns)
+        df = df[[col for col in df.columns if col in wanted]]
+    return df
@@ -0,0 +1,180 @@
+# ----------------------------
+# File: utils/tracing.py
+# ----------------------------
+# Opt-in per-rerun tracing. With DASHBOARD_TRACE=1, hot calls (Mongo, LLM,
+# pandas, chart building and rendering) record named spans with duration and
+# rows/bytes/tokens; each rerun's spans are kept for the sidebar waterfall and
+# written as one JSON line to the dashboard.trace logger (and
+# DASHBOARD_TRACE_FILE if set). With the flag off, span() hands back a shared
+# no-op and traced() returns the function untouched.
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import streamlit as st
+
+TRACE_ENABLED = os.getenv("DASHBOARD_TRACE", "0").lower() in ("1", "true", "yes")
+TRACE_FILE = os.getenv("DASHBOARD_TRACE_FILE")
+TRACE_HISTORY = 5
+
+logger = logging.getLogger("dashboard.trace")
+if TRACE_ENABLED and TRACE_FILE and not logger.handlers:
+    handler = logging.FileHandler(TRACE_FILE)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+# Streamlit runs each session's script (and its fragments) on its own thread
+_local = threading.local()
+
+
+class _NoopSpan:
+    def set(self, **attrs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class Trace:
+    def __init__(self, label):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.spans = []
+        self.depth = 0
+
+    def to_dict(self):
+        return {"trace_id": self.id, "label": self.label, "started_at": self.started_at, "spans": self.spans}
+
+
+class Span:
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.record = {"name": name, **attrs}
+
+    def set(self, **attrs):
+        self.record.update(attrs)
+        return self
+
+    def __enter__(self):
+        self.record["depth"] = self.trace.depth
+        self.trace.depth += 1
+        self._start = time.perf_counter()
+        self.record["start_ms"] = round((self._start - self.trace._t0) * 1000, 2)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.record["duration_ms"] = round((time.perf_counter() - self._start) * 1000, 2)
+        if exc_type is not None:
+            self.record["error"] = exc_type.__name__
+        self.trace.depth -= 1
+        self.trace.spans.append(self.record)
+        return False
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+
+def span(name, **attrs):
+    """Context manager timing a block; `.set(rows=..., bytes=..., tokens=...)` adds measurements."""
+    trace = current_trace() if TRACE_ENABLED else None
+    if trace is None:
+        return _NOOP
+    return Span(trace, name, attrs)
+
+
+def traced(name, **measures):
+    """Decorator form of span(); `measures` map attribute names to functions of the result."""
+    def decorate(fn):
+        if not TRACE_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name) as s:
+                result = fn(*args, **kwargs)
+                for attr, measure in measures.items():
+                    try:
+                        s.set(**{attr: measure(result)})
+                    except Exception:
+                        pass
+                return result
+        return wrapper
+    return decorate
+
+
+def frame_stats(df):
+    """rows/bytes for a DataFrame span (shallow memory, so it stays cheap)."""
+    if df is None:
+        return {}
+    return {"rows": len(df), "bytes": int(df.memory_usage(index=False).sum())}
+
+
+def start_rerun(label="rerun"):
+    if not TRACE_ENABLED:
+        return None
+    finish_rerun()
+    _local.trace = Trace(label)
+    return _local.trace
+
+
+def finish_rerun():
+    """Log the current trace and keep it for the debug panel."""
+    trace = current_trace()
+    if trace is None or not trace.spans:
+        return
+    _local.trace = None
+    logger.info(json.dumps(trace.to_dict(), default=str))
+    history = st.session_state.setdefault("traces", [])
+    history.append(trace.to_dict())
+    del history[:-TRACE_HISTORY]
+
+
+def plotly_chart(fig, **kwargs):
+    # Rendering includes the figure's JSON serialization, often the slowest step for big traces
+    if not TRACE_ENABLED:
+        return st.plotly_chart(fig, **kwargs)
+    with span("plotly_chart", points=sum(len(t.x) if getattr(t, "x", None) is not None else 0 for t in fig.data)):
+        return st.plotly_chart(fig, **kwargs)
+
+
+def render_trace_panel():
+    """Sidebar waterfall of the most recent finished reruns."""
+    if not TRACE_ENABLED:
+        return
+    import pandas as pd
+    import plotly.graph_objects as go
+
+    traces = st.session_state.get("traces", [])
+    with st.expander("🐞 Debug: rerun traces", expanded=False):
+        if not traces:
+            st.caption("No finished reruns traced yet.")
+            return
+        labels = [f"{t['label']} · {time.strftime('%H:%M:%S', time.localtime(t['started_at']))}" for t in traces]
+        chosen = st.selectbox("Rerun", range(len(traces)), index=len(traces) - 1, format_func=lambda i: labels[i])
+        spans = pd.DataFrame(traces[chosen]["spans"]).sort_values("start_ms")
+        # Numbered so repeated span names keep their own rows
+        names = [f"{i:>2} {'· ' * depth}{name}" for i, (depth, name) in enumerate(zip(spans["depth"], spans["name"]), 1)]
+        fig = go.Figure(go.Bar(
+            x=spans["duration_ms"], base=spans["start_ms"], y=names, orientation="h",
+            hovertext=[json.dumps({k: v for k, v in row.items() if pd.notna(v)}, default=str) for row in spans.to_dict("records")],
+        ))
+        fig.update_layout(
+            height=max(200, 22 * len(spans)), margin=dict(l=0, r=0, t=10, b=0),
+            xaxis_title="ms since rerun start", yaxis=dict(autorange="reversed"), template="plotly_white"
+        )
+        st.plotly_chart(fig, width="stretch")
+        st.dataframe(spans.drop(columns=["depth"]), width="stretch")